@@ -1,15 +1,31 @@
 # ----------------------------------------------------------------------------------------
 # prepare environment (boilerplate)
 
+# time and memory of each stage of loading the app, when enabled by the environment variable STARTUP_PROFILE (see startupProfile.py)
+import startupProfile
+
 # import the required packages using their usual aliases
 import dash
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
+import plotly
 import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
-import humanize
+import gc
 import os
+import pandas as pd
+import json
+startupProfile.mark('import dash and plotly')
+import countryStats
+import dataStore
+import callbackMetrics
+import figureCache
+import staticFigures
+import soilIndex
+import soilMap
+import tradeCube
+import tradeIndex
+startupProfile.mark('import app modules')
 
 # read token string with your access mapbox token from a hidden file
 # saved in environment's root directory same as where this app.py file is
@@ -22,18 +38,48 @@ mapbox_access_token = os.environ.get('MAPBOX_ACCESS_TOKEN')
 # -- read the food trade matrix data into pandas from CSV file of 2019 export quantities (exported from analysis in Jupyter Notebook)
 # prepared using original dataset FAOSTAT Detailed trade matrix: All Data Normalized from https://fenixservices.fao.org/faostat/static/bulkdownloads/Trade_DetailedTradeMatrix_E_All_Data_(Normalized).zip
 # with appended key demographics from FAOSTAT Key dataset (in Jupyter Notebook)
-# # full dataset
-dffood = pd.read_csv('./data/dffood.csv')
+# # full dataset, from its columnar store when built with `python dataStore.py`, otherwise from CSV
+dffood = dataStore.load_food()
+startupProfile.mark('load dffood')
+# -- the food trade rows indexed by exporting country, importing country and item, for a trade partner's exports
+# (memory-mapped from its prebuilt arrays when built with `python dataStore.py`, see sharedArrays.py)
+foodTrade = tradeIndex.load(dffood)
+startupProfile.mark('trade index')
+# -- the food trade summed by importing country with its source countries and with its items, for the At Risk Foods drill-down
+# (memory-mapped from its prebuilt arrays when built with `python dataStore.py`)
+foodCube = tradeCube.load(dffood)
+startupProfile.mark('trade cube')
 
 # -- read the 4.5 depth soil organic carbon density (%) measurements pre-filtered for audience China's and U.S.'s food's trade export Reporter Countries (exported from analysis in Jupyter Notebook)
 # prepared using original dataset Soil organic carbon density: SOCD5min.zip from http://globalchange.bnu.edu.cn/research/soilw
 # with appended country name and ISO3 code from GeoPandas embedded World dataset
-dfsoil = pd.read_csv('./data/dfsoil_subUSCN_prod.csv')
+# only when the data is not built: the soil point index and statistics are otherwise read from their prebuilt files
+dfsoil = None if dataStore.built_version() else dataStore.load_soil()
+startupProfile.mark('load dfsoil')
+# -- show what each dataset's columns hold in memory, to see the savings of their compact dtypes (see dataStore.py)
+dataStore.report_memory('dffood', dffood)
+if dfsoil is not None:
+    dataStore.report_memory('dfsoil', dfsoil)
+# -- soil points partitioned by country, so the map callback slices a country's points instead of filtering all rows
+soilPoints = soilIndex.load(dfsoil)
+startupProfile.mark('soil point index')
+# -- one row of soil statistics per country (mean, count, range and quartiles of SOCD), for the dropdown and bar chart
+dfsoilStats = countryStats.load(dfsoil)
+# -- each trade partner's ISO3 code, linking the soil data's country names to the trade data's exporters
+partnerCodes = dfsoilStats.drop_duplicates(subset=['Reporter_Country_name']).set_index('Reporter_Country_name')['Reporter_Country_ISO3']
+# -- the map draws from the soil point index, so any soil dataframe loaded is not kept for the workers
+del dfsoil
+startupProfile.mark('soil statistics')
+
+# client-side render timings of the soil map (assets/mapTimings.js), served only with the environment variable MAP_TIMINGS=1,
+# as it wraps the page's fetch and logs to the browser console
+MAP_TIMINGS = os.environ.get('MAP_TIMINGS', '0') == '1'
 
 # ----------------------------------------------------------------------------------------
 # create (instantiate) the app,
 # using the Bootstrap MORPH theme, Slate (dark) or Flatly (light) theme or Darkly (its dark counterpart) to align with my llc website in development with Flatly (dadeda.design)
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.MORPH],
+                assets_ignore='' if MAP_TIMINGS else r'mapTimings\.js',
                 meta_tags=[{'name': 'viewport',
                             # initial-scale is the initial zoom on each device on load
                             'content': 'width=device-width, initial-scale=1.0, maximum-scale=1.2, minimum-scale=0.5'}]
@@ -41,6 +87,8 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.MORPH],
 
 server = app.server
 app.title = 'Sustain-Our-Soil-for-Our-Food'
+# per-callback latency, response size and phase timings, served by the app at /metrics (see callbackMetrics.py)
+metrics = callbackMetrics.CallbackMetrics(app)
 
 # ----------------------------------------------------------------------------------------
 # named variables for the app's layout
@@ -171,26 +219,42 @@ whyCarbon = dbc.Card(
 dropdownReporterCountry = dbc.CardBody(
     html.Div(children=[
         # add a brief instructive subheading as a label
-        dbc.Label('Choose a trade partner.', style={'text-align': 'left'}
+        dbc.Label('Choose one or more trade partners.', style={'text-align': 'left'}
                   ),
-        # add a dropdown for audience member using app to select a reporter country (their partner who exports the food they've chosen to their country)
+        # add a dropdown for audience member using app to select reporter countries (their partners who export the food they've chosen to their country)
         dcc.Dropdown(id='reporter_country_dropdown',
                      options=[{'label': country, 'value': country}
                               # series values needed to be sorted first before taking unique to prevent errors
-                              for country in dfsoil['Reporter_Country_name'].sort_values().unique()],
+                              for country in dfsoilStats['Reporter_Country_name'].sort_values().unique()],
                      placeholder='Trade Partner',
                      searchable=True,
                      clearable=True,  # shows an 'X' option to clear selection once selection is made
                      persistence=True,  # True is required to use a persistence_type
                      persistence_type='session',  # remembers dropdown value selection until browser tab is closed (saves after refresh)
-                     multi=False,  # do not allow multiple country selections (default); doing so would require more code development in callback function
+                     multi=True,  # allow multiple country selections, to compare trade partners side by side on the map
+                     style={"width": "75%"}
+                     )
+    ])
+)
+
+dropdownSOCDDepth = dbc.CardBody(
+    html.Div(children=[
+        dbc.Label('Choose a soil depth.', style={'text-align': 'left'}
+                  ),
+        # the SOCD depths of the soil data, for the map and the Density Ranges chart
+        dcc.Dropdown(id='socd_depth_dropdown',
+                     options=[{'label': f'{depth:g} cm', 'value': depth} for depth in soilPoints.depths],
+                     value=soilIndex.DEPTH,
+                     clearable=False,
+                     persistence=True,
+                     persistence_type='session',
                      style={"width": "75%"}
                      )
     ])
 )
 
 controls = html.Div(children=[
-    dbc.CardGroup([dropdownReporterCountry, tooltip], class_name="card border-primary bg-light mb-2")
+    dbc.CardGroup([dropdownReporterCountry, dropdownSOCDDepth, tooltip], class_name="card border-primary bg-light mb-2")
     ]
 )
 
@@ -201,12 +265,27 @@ mapExplorer = dbc.Card([
                ),
         html.Div(controls),
         html.Div(id='map-socd',
-                 ),
+                 children=[
+                     # one map for the whole session, its figure updated by the callback below as selections and zoom change
+                     dcc.Graph(id='map-socd-graph',
+                               config={'displayModeBar': True, 'scrollZoom': True}
+                               ),
+                     # the country and level of detail the map is showing
+                     dcc.Store(id='map-socd-view'),
+                     # the lon, lat and size arrays of the map's points when only they change, and how many were drawn
+                     dcc.Store(id='map-socd-trace'),
+                     dcc.Store(id='map-socd-restyled'),
+                     # with MAP_CLIENTSIDE=1, the map's settings, sent when the page is loaded, the points of the countries
+                     # selected for the first time on the page, and the names of the countries whose points were sent
+                     dcc.Store(id='map-socd-points', storage_type='memory'),
+                     dcc.Store(id='map-socd-country-points', storage_type='memory'),
+                     dcc.Store(id='map-socd-loaded', storage_type='memory')
+                 ]),
     ]),
     html.Br(),
 
     html.Div(children=[
-        html.P("Dots on the map vary in size by the location's soil organic carbon density (SOCD), which can be understood as how much of the soil is made up of organic carbon, from the ground surface down to 4.5 centimeters deep. These density estimates are by global leading scientists from the available worldwide soil data––collected and mathematically modelled––and are expressed in metric tonnes per hectare (t ha-1), which are equal to about 1,000 kilograms or aproximately 2,205 pounds.",
+        html.P("Dots on the map vary in size by the location's soil organic carbon density (SOCD), which can be understood as how much of the soil is made up of organic carbon, from the ground surface down to the soil depth chosen above the map. These density estimates are by global leading scientists from the available worldwide soil data––collected and mathematically modelled––and are expressed in metric tonnes per hectare (t ha-1), which are equal to about 1,000 kilograms or aproximately 2,205 pounds.",
                style={'text-align': 'left'}),
         html.P("Read more about carbon's importance in soil below.",
                style={'text-align': 'left'}),
@@ -223,43 +302,9 @@ mapExplorer = dbc.Card([
 ], body=True)
 
 # --------------------------SOIL BAR graph--------------------------
-# take the mean SOCD by grouping soil dataframe by Country and append the mean as a column
-dfsoil['SOCDcountryMean'] = dfsoil['Reporter_Country_SOCD_depth4_5'].groupby(dfsoil['Reporter_Country_name']).transform('mean')
-# drop the raw SOCD values from the subset of soil data; used in density ranges bar chart
-dfsoilMeans = dfsoil.drop_duplicates(subset=['Reporter_Country_name', 'Reporter_Country_continent', 'SOCDcountryMean', 'Reporter_Country_pop_est']).drop(['Reporter_Country_SOCD_depth4_5'], axis=1).sort_values(by=['SOCDcountryMean', 'Reporter_Country_continent', 'Reporter_Country_name'], ascending=(False, True, True))
-dfsoilMeansMaxOrder = ['Africa', 'Oceania', 'South America', 'Asia', 'North America', 'Europe']
-# make numbers into a more human readable format, e.g., transform 12345591313 to '12.3 billion' for hover info
-dfsoilMeans['humanPop'] = dfsoilMeans['Reporter_Country_pop_est'].apply(lambda x: humanize.intword(x))
-
-# make a bar chart showing range of mean by countries, overlay countries within continent group to retain mean y axis levels
-rangeSOCDfig = px.bar(dfsoilMeans, x='Reporter_Country_continent', y='SOCDcountryMean', color='SOCDcountryMean', barmode='overlay',
-                      # set bolded title in hover text, and make a list of columns to customize how they appear in hover text
-                      custom_data=['Reporter_Country_name',
-                                   'Reporter_Country_continent',
-                                   'SOCDcountryMean',
-                                   'humanPop'
-                                   ],
-                      color_continuous_scale=px.colors.sequential.speed,  # alternately use turbid for more muted yellows to browns (speed for yellow to green to black scale)
-                      # a better label that will display over color legend
-                      labels={'SOCDcountryMean': 'Avg.<br>SOCD'},
-                      # lower opacity to help see variations of color between countries as means change
-                      opacity=0.20
-                      )
-# sort bars by mean SOCD, and suppress redundant axis titles, instead of xaxis={'categoryorder': 'mean ascending'} I pre-sorted the dataframe above, but still force sort here by explicit names
-rangeSOCDfig.update_layout(xaxis={'categoryorder': 'array', 'categoryarray': dfsoilMeansMaxOrder},
-                           xaxis_title=None, yaxis_title=None,  # removed xaxis_tickangle=-45, # used to angle longer/more xaxis labels
-                           paper_bgcolor='#e8ece8',  # next tint variation up from a low tint of #dadeda
-                           plot_bgcolor='#f7f5fc',  # violet tone of medium purple to help greens pop forward
-                           yaxis={'gridcolor': '#e8ece8'},  # match grid lines shown to background to appear as showing through
-                           font={'color': '#483628'})  # a dark shade of orange that appears dark brown
-rangeSOCDfig.update_traces(
-    hovertemplate="<br>".join([
-        "<b>%{customdata[0]} </b><br>",  # bolded hover title included, since the separate hover_name is superseced by hovertemplae
-        "%{customdata[1]}",  # Continent value with no label
-        "Average SOCD: %{customdata[2]:.1f} t ha<sup>−1</sup>",  # with html <sup> superscript tag in abbr. metric tonnes per hectare (t ha-1) t ha<sup>−1</sup> formatted to 2 decimals
-        "Estimated Population (2019): %{customdata[3]} people"  # in humanized format
-    ])
-)
+# bar chart of the range of average SOCD by countries, prebuilt with `python dataStore.py` (see staticFigures.py)
+rangeSOCDfig = staticFigures.load('densityRanges', dfsoilStats)
+startupProfile.mark('density ranges chart')
 
 
 densityRanges = dbc.Card([
@@ -289,46 +334,9 @@ densityRanges = dbc.Card([
 ], body=True)
 
 # --------------------------FOOD TRADE graph--------------------------
-
-# take the sum total of exported tonnes by grouping food dataframe by Partner (importing) Country and append the sum as a column
-dffood['Export_Quantity_Sum'] = dffood['Export_Quantity_2019_Value_tonnes'].groupby(dffood['Partner_Country_name']).transform('sum')
-# take the distinct count of exported items by grouping food dataframe by Reporter (exporting) Country and append the count as a column
-dffood['Export_Items_Count'] = dffood['Item'].groupby(dffood['Partner_Country_name']).transform('nunique')
-# make numbers into a more human readable format, e.g., transform 12345591313 to '12.3 billion' for hover info
-dffood['tradeVolume'] = dffood['Export_Quantity_Sum'].apply(lambda x: humanize.intword(x))
-
-
-# food data scatterplot points
-RiskFoodsFig = px.scatter(dffood, x='Export_Items_Count', y='Export_Quantity_Sum', size='Export_Quantity_Sum',
-                          custom_data=['Partner_Country_name',  # 'Reporter_Country_name_x',
-                                       'Export_Quantity_Sum',
-                                       'Export_Items_Count'
-                                       ]
-                          )
-
-# sort bars by mean SOCD, and suppress redundant axis titles, instead of xaxis={'categoryorder': 'mean ascending'} I pre-sorted the dataframe above, but still force sort here by explicit names
-RiskFoodsFig.update_layout(
-                           xaxis_title='Diversity of Foods Imported (How many unique items?)',  # Exported (How many unique items?)',
-                           # move yaxis text to title area for readability; add empty line above it so it appears below the plotly toolbar options
-                           title='<br>Volume as Total Quantity of Foods Imported (tonnes)',
-                           yaxis_title='',  # moved to title attribute for readability
-                           paper_bgcolor='#e8ece8',  # next tint variation up from a low tint of #dadeda
-                           plot_bgcolor='#f7f5fc',  # violet tone of medium purple to help greens pop forward
-                           yaxis={'gridcolor': '#e8ece8'},  # match grid lines shown to background to appear as showing through
-                           font={'color': '#483628'})  # a dark shade of orange that appears dark brown
-RiskFoodsFig.update_traces(
-    # hard code single point color
-    marker=dict(
-        color='#a99e54',
-        sizemin=10
-    ),
-    # set bolded title in hover text, and make a list of columns to customize how they appear in hover text
-    hovertemplate="<br>".join([
-        "<b>%{customdata[0]} </b><br>",  # bolded hover title included, since the separate hover_name is superseced by hovertemplae
-        "Trade Volume: %{customdata[1]:,} tonnes imported",  # %{customdata[2]:,} tonnes exported", # note html tags can be used in string; comma sep formatted; note with tradeVolume use format .1f to 1 decimals
-        "Trade Diversity: %{customdata[2]:} unique food products imported"  # %{customdata[3]:} unique food products exported",
-    ])
-)
+# scatterplot of food trade reliance by volume and diversity, prebuilt with `python dataStore.py` (see staticFigures.py)
+RiskFoodsFig = staticFigures.load('riskFoods', dffood)
+startupProfile.mark('at risk foods chart')
 
 riskFoods = dbc.Card([
     html.Div(children=[
@@ -337,7 +345,9 @@ riskFoods = dbc.Card([
         dcc.Graph(figure=RiskFoodsFig,
                   id="food-quadrant-chart",
                   config={'displayModeBar': True, 'scrollZoom': True}
-                  )
+                  ),
+        # the top source countries and foods of the country whose point is clicked
+        html.Div(id="food-partner-sources")
     ]),
     html.Br(),
 
@@ -358,10 +368,36 @@ riskFoods = dbc.Card([
     html.Br()
 ], body=True)
 
+# --------------------------PARTNER EXPORTS table--------------------------
+# the foods the trade partners chosen above the map export, and the countries they export them to
+partnerExports = dbc.Card([
+    html.Div(children=[
+        html.H5("What Your Trade Partners Export, and to Whom"
+                ),
+        html.Div(id="partner-exports-tables")
+    ]),
+    html.Br(),
+
+    html.Div(children=[
+        html.P("Rows show each food item a trade partner exported in 2019 and a country it was exported to, largest quantities first, in metric tonnes.",
+               style={'text-align': 'left'}),
+        html.P(children=["Food and Agriculture Organization of the United Nations. (2020). FAOSTAT Detailed trade matrix: All Data Normalized. ",
+                         html.A('https://www.fao.org/faostat/en/#data/TM',
+                                href='https://www.fao.org/faostat/en/#data/TM',
+                                target="_blank"  # opens link in new tab or window
+                                )
+                         ],
+               style={'text-align': 'left'}
+               )
+    ]),
+    html.Br()
+], body=True)
+
 tab1 = dbc.Tab([densityRanges], label="Density Ranges")
 tab2 = dbc.Tab([riskFoods], label="At Risk Foods")
-tab3 = dbc.Tab([whyCarbon], label="Why Carbon?")
-tabs = dbc.Tabs(children=[tab1, tab2, tab3])
+tab3 = dbc.Tab([partnerExports], label="Partner Exports")
+tab4 = dbc.Tab([whyCarbon], label="Why Carbon?")
+tabs = dbc.Tabs(children=[tab1, tab2, tab3, tab4])
 
 
 # create the app's layout with the named variables
@@ -437,68 +473,295 @@ app.layout = dbc.Container(
     fluid=True,
     className="dbc"
 )
+startupProfile.mark('app layout')
 
 # ----------------------------------------------------------------------------------------
 # callback decorators and functions
 # connecting the Dropdown values to the graph
 
+# optional clientside map, with the environment variable MAP_CLIENTSIDE=1: a country's points, at the level of detail
+# fitting the country into view, are sent as base64 float32 arrays the first time it is selected on a page, and later
+# selections of it swap the map's trace in the browser (assets/soilMap.js) without a request to the server; zooming in
+# then draws no finer detail
+MAP_CLIENTSIDE = os.environ.get('MAP_CLIENTSIDE', '0') == '1'
 
-# simple selection on country directly
-@app.callback(
-    Output('map-socd', 'children'),
-    [Input('reporter_country_dropdown', 'value')]
-)
-def update_selected_reporter_country(selected_reporter_country):
-    # always make a copy of any dataframe to use in the function
-    # define the subset of data that matches the selected values from both dropdown(s)
-    dfsoil_sub = dfsoil
-    # filter dataframe with geo points for single selection multi=False (default)
-    dfsoil_sub1 = dfsoil_sub[(dfsoil_sub['Reporter_Country_name'] == selected_reporter_country)]
-
-    # create figure variables for the graph object
-    locations = [go.Scattermapbox(
-        name='SOCD at Surface Depth to 4.5cm',
-        lon=dfsoil_sub1['Reporter_Country_lon'],
-        lat=dfsoil_sub1['Reporter_Country_lat'],
+# bounded cache of serialized map figures by selected country and level of detail, sized by environment variables
+# MAP_CACHE_ENTRIES (figures), MAP_CACHE_MB (megabytes of figure JSON text) and MAP_CACHE_PREWARM (countries built at startup)
+MAP_CACHE_PREWARM = int(os.environ.get('MAP_CACHE_PREWARM', 8))
+mapFigures = figureCache.FigureCache(max_entries=int(os.environ.get('MAP_CACHE_ENTRIES', 64)),
+                                     max_bytes=int(float(os.environ.get('MAP_CACHE_MB', 256)) * 2**20))
+for stat in ('entries', 'bytes', 'hits', 'misses', 'evictions'):
+    metrics.gauge(f'dash_map_figure_cache_{stat}', f'Map figure cache {stat}, in this process.', lambda stat=stat: mapFigures.stats()[stat])
+
+
+# bright hues for contrast with the imagery, one for each selected country in the order they were selected
+MAP_COLORS = ['fuchsia', 'aqua', 'yellow', 'lime', 'orange', 'white']
+
+
+# the map trace of one country's encoded points
+def country_trace(country, points, color):
+    return go.Scattermapbox(
+        name=country,
+        lon=points['lon'],
+        lat=points['lat'],
         mode='markers',
         marker=go.scattermapbox.Marker(
-                                       size=dfsoil_sub['Reporter_Country_SOCD_depth4_5'],
-                                       color='fuchsia',  # bright hue for contrast
+                                       size=points['size'],
+                                       color=color,
                                        opacity=0.7
                                        ),
-        hovertemplate="Longitude: %{lon}<br>" + "Latitude: %{lat}<br><extra></extra>"  # hide secondary tag with empty extra tag
+        hovertemplate="Longitude: %{lon}<br>" + "Latitude: %{lat}<br><extra>%{fullData.name}</extra>"  # country name in the secondary tag
         )
-    ]
 
-    # add a mapbox image layer below the data
-    layout = go.Layout(
-                uirevision='foo',  # preserves state of figure/map after callback activated
-                clickmode='event+select',
-                hovermode='closest',
-                hoverdistance=2,
-                mapbox=dict(
-                    accesstoken=mapbox_access_token,
-                    style='white-bg'
-                ),
-                autosize=True,
-                margin=dict(l=0, r=0, t=0, b=0),
-                mapbox_layers=[
-                    {
-                        'below': 'traces',
-                        'sourcetype': 'raster',
-                        'source': [
-                            "https://basemap.nationalmap.gov/arcgis/rest/services/USGSImageryOnly/MapServer/tile/{z}/{y}/{x}"
-                        ]
-                    }
-                ]
+
+# the encoded points of the selected countries at a level of detail and SOCD depth, one slice per country
+def country_points(countries, level, window=None, depth=soilIndex.DEPTH):
+    # slice the geo points of every selected country from the per-country index at the level of detail for the
+    # map's zoom, gathered together from their row ranges (or those of the buckets in view), without scanning
+    # the rest of the dataset, and at most soilIndex.MAX_POINTS of them in all,
+    # and round them to the precision of the data, to send only compact arrays of the points drawn
+    with metrics.phase('filter'):
+        return [soilMap.encode_points(points) for points in soilPoints.select(countries, level, window=window, depth=depth)]
+
+
+# the map legend's title, naming the SOCD depth drawn
+def map_legend_title(depth):
+    return f'SOCD at Depth {depth:g}cm'
+
+
+# the map figure for the selected countries at one level of detail and SOCD depth, of the whole countries or the lon/lat window in view
+def country_map_figure(selected_reporter_countries, level, window=None, depth=soilIndex.DEPTH):
+    countries = soilIndex.selected(selected_reporter_countries)
+    points = country_points(countries, level, window, depth)
+
+    with metrics.phase('figure'):
+        # create figure variables for the graph object, a trace for each country
+        locations = [country_trace(country, trace, MAP_COLORS[i % len(MAP_COLORS)])
+                     for i, (country, trace) in enumerate(zip(countries, points))]
+
+        # add a mapbox image layer below the data
+        layout = go.Layout(
+                    uirevision=', '.join(countries),  # preserves state of figure/map after callback activated, until the selection changes
+                    clickmode='event+select',
+                    hovermode='closest',
+                    hoverdistance=2,
+                    legend=dict(title_text=map_legend_title(depth), x=0, y=1, bgcolor='rgba(255, 255, 255, 0.7)'),
+                    mapbox=dict(
+                        accesstoken=mapbox_access_token,
+                        style='white-bg',
+                        **soilMap.country_view(soilPoints, countries)  # centered and zoomed to show all the selected countries
+                    ),
+                    autosize=True,
+                    margin=dict(l=0, r=0, t=0, b=0),
+                    mapbox_layers=[
+                        {
+                            'below': 'traces',
+                            'sourcetype': 'raster',
+                            'source': [
+                                "https://basemap.nationalmap.gov/arcgis/rest/services/USGSImageryOnly/MapServer/tile/{z}/{y}/{x}"
+                            ]
+                        }
+                    ]
+        )
+
+    return {'data': locations, 'layout': layout}
+
+
+# build the whole selected countries' map figure at a depth, serialized to JSON text for the figure cache
+def build_country_map(key):
+    selected_reporter_countries, level, depth = key
+    figure = country_map_figure(selected_reporter_countries, level, depth=depth)
+    # Return figure as JSON text
+    with metrics.phase('serialize'):
+        return json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+# selection of countries directly, and the map's zoom and bounds choosing the level of detail and points drawn:
+# a selection updates the map's whole figure, and a zoom or pan only its traces' arrays, as does a new depth of the
+# points in view after the map was moved; the selected countries share one point budget
+def update_selected_reporter_country(selected_reporter_countries, depth, relayoutData, view):
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    countries = soilIndex.selected(selected_reporter_countries)
+    metrics.countries(countries, known=soilPoints.positions)
+    view = view or {}
+    sameCountries = 'reporter_country_dropdown.value' not in triggered and view.get('countries') == countries
+    if 'map-socd-graph.relayoutData' in triggered and 'reporter_country_dropdown.value' not in triggered:
+        # the map was zoomed or moved; other relayouts (e.g. autosize) do not change the points drawn
+        zoom = (relayoutData or {}).get('mapbox.zoom')
+        corners = (relayoutData or {}).get('mapbox._derived', {}).get('coordinates')
+        if zoom is None or corners is None or not countries:
+            raise PreventUpdate
+        # query the points in view and around it, found through the spatial buckets, so a region at high zoom
+        # loads only its own points however large the countries are
+        inView = soilIndex.viewport(corners)
+        window = soilIndex.pad(inView)
+        level = soilPoints.level_for(countries, zoom, window=window)
+        # nothing to send while the map stays inside the points already drawn at this level and depth
+        if sameCountries and view.get('level') == level and view.get('depth') == depth \
+                and soilIndex.contains(view.get('window'), inView):
+            raise PreventUpdate
+    elif 'socd_depth_dropdown.value' in triggered and sameCountries and view.get('window'):
+        # the same window of points at the new depth
+        window, level = view['window'], view['level']
+    else:
+        # a new selection is shown whole, at the zoom fitting the countries into view
+        zoom = soilMap.country_view(soilPoints, countries)['zoom']
+        level = soilPoints.level_for(countries, zoom)
+        # serve the figure from the cache, so repeat selections skip building it
+        figure = json.loads(mapFigures.get_or_build((tuple(countries), level, depth), build_country_map))
+        return figure, dash.no_update, {'countries': countries, 'level': level, 'window': None, 'depth': depth}
+
+    # the map's settings and view are unchanged, so send only the traces' arrays, restyled into the map in the browser,
+    # and the legend's title, which names the depth
+    traces = {'traces': country_points(countries, level, window, depth), 'layout': {'legend.title.text': map_legend_title(depth)}}
+    return dash.no_update, traces, {'countries': countries, 'level': level, 'window': window, 'depth': depth}
+
+
+# every country's map points for the clientside map, at the level of detail fitting each country into view and at the
+# surface depth (the depth selector is not applied to the clientside map), with its extent
+def build_session_points():
+    countries = {}
+    for country in soilPoints.countries:
+        view = soilMap.country_view(soilPoints, country)
+        points = soilPoints.slice(country, soilPoints.level_for(country, view['zoom']))
+        countries[country] = dict(soilMap.encode_points_binary(points), bounds=soilMap.country_bounds(soilPoints, country))
+    return countries
+
+
+# the clientside map's settings: the figure the points are drawn in (an empty selection's) with the settings of a
+# country's trace, which the browser fills in, and the names of the countries it has points for
+def build_session_map():
+    trace = country_trace(None, {'lon': [], 'lat': [], 'size': []}, MAP_COLORS[0])
+    return {'figure': json.loads(build_country_map(((), 0, soilIndex.DEPTH))), 'countries': soilPoints.countries,
+            'trace': json.loads(json.dumps(trace, cls=plotly.utils.PlotlyJSONEncoder)), 'colors': MAP_COLORS,
+            'maxPoints': soilIndex.MAX_POINTS, 'mapPixels': soilMap.MAP_PIXELS}
+
+
+if MAP_CLIENTSIDE:
+    # built once at startup (with gunicorn --preload, once in the parent for every worker)
+    sessionPoints = build_session_points()
+    sessionMap = build_session_map()
+    startupProfile.mark('clientside map points')
+
+    # send the map's settings when the page is loaded, as the store starts empty
+    @app.callback(
+        Output('map-socd-points', 'data'),
+        [Input('map-socd-points', 'modified_timestamp')],
+        [State('map-socd-points', 'data')]
+    )
+    def send_session_map(timestamp, data):
+        if data:
+            raise PreventUpdate
+        return sessionMap
+
+    # send the points of only the selected countries the page has not been sent yet
+    @app.callback(
+        [Output('map-socd-country-points', 'data'), Output('map-socd-loaded', 'data')],
+        [Input('reporter_country_dropdown', 'value')],
+        [State('map-socd-loaded', 'data')]
+    )
+    def send_session_points(selected_reporter_countries, loaded):
+        loaded = loaded or []
+        countries = [country for country in soilIndex.selected(selected_reporter_countries)
+                     if country in sessionPoints and country not in loaded]
+        if not countries:
+            raise PreventUpdate
+        return {country: sessionPoints[country] for country in countries}, loaded + countries
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='soilMap', function_name='selectCountry'),
+        Output('map-socd-graph', 'figure'),
+        [Input('reporter_country_dropdown', 'value'), Input('map-socd-points', 'data'), Input('map-socd-country-points', 'data')]
+    )
+else:
+    app.callback(
+        [Output('map-socd-graph', 'figure'), Output('map-socd-trace', 'data'), Output('map-socd-view', 'data')],
+        [Input('reporter_country_dropdown', 'value'), Input('socd_depth_dropdown', 'value'), Input('map-socd-graph', 'relayoutData')],
+        [State('map-socd-view', 'data')]
+    )(update_selected_reporter_country)
+
+    # apply trace arrays (and the legend title) to the map in place with Plotly.update, keeping its mapbox GL context, tiles and view
+    app.clientside_callback(
+        ClientsideFunction(namespace='soilMap', function_name='restyleTrace'),
+        Output('map-socd-restyled', 'data'),
+        [Input('map-socd-trace', 'data')]
     )
 
-    # Return figure
-    return dcc.Graph(config={'displayModeBar': True, 'scrollZoom': True},
-                     figure={
-                         'data': locations,
-                         'layout': layout
-                     })
+    # pre-warm the figure cache with the trade partners exporting the most food, matched from trade data to soil data by ISO3 code
+    # (with gunicorn --preload this runs once in the parent, and every worker starts with a warm cache)
+    partnerNames = dfsoilStats.drop_duplicates(subset=['Reporter_Country_ISO3']).set_index('Reporter_Country_ISO3')['Reporter_Country_name']
+    popularPartners = dffood.groupby('Reporter_Country_ISO3', observed=True)['Export_Quantity_2019_Value_tonnes'].sum().nlargest(MAP_CACHE_PREWARM).index
+    popularPartners = [partnerNames[iso] for iso in popularPartners if iso in partnerNames.index]
+    startupProfile.mark('map callbacks')
+    mapFigures.prewarm([((country,), soilPoints.level_for(country, soilMap.country_view(soilPoints, country)['zoom']), soilIndex.DEPTH) for country in popularPartners], build_country_map)
+    startupProfile.mark('map figure cache prewarm')
+
+
+# the Density Ranges chart at the selected depth, each depth's prebuilt chart loaded on its first selection
+densityFigures = {soilIndex.DEPTH: rangeSOCDfig}
+
+
+@app.callback(
+    Output('SOCD-bar-chart', 'figure'),
+    [Input('socd_depth_dropdown', 'value')]
+)
+def update_selected_depth(depth):
+    if depth not in densityFigures:
+        densityFigures[depth] = staticFigures.load(staticFigures.density_ranges_name(depth))
+    return densityFigures[depth]
+
+# rows of each selected trade partner's exports listed, the largest
+EXPORT_ROWS = 25
+
+
+# the foods each selected trade partner exports and the countries importing them, looked up from the trade index by
+# the partner's ISO3 code (reading only that exporter's rows of the trade data)
+@app.callback(
+    Output('partner-exports-tables', 'children'),
+    [Input('reporter_country_dropdown', 'value')]
+)
+def update_partner_exports(selected_reporter_countries):
+    countries = soilIndex.selected(selected_reporter_countries)
+    if not countries:
+        return html.P("Choose a trade partner above the map to see the foods it exports, and to which countries.",
+                      style={'text-align': 'left'})
+    children = []
+    for country in countries:
+        rows = foodTrade.exports(partnerCodes.get(country), limit=EXPORT_ROWS)
+        if not len(rows):
+            children.append(html.H6(f"{country}: no food exports recorded in 2019", style={'text-align': 'left'}))
+            continue
+        tonnes, items, partners = foodTrade.export_totals(partnerCodes.get(country))
+        children.append(html.H6(f"{country} exported {tonnes:,.0f} tonnes of {items:,} foods to {partners:,} countries in 2019",
+                                style={'text-align': 'left'}))
+        children.append(dbc.Table.from_dataframe(
+            pd.DataFrame({'Food Item': rows[tradeIndex.ITEM],
+                          'Exported To': rows[tradeIndex.PARTNER],
+                          'Tonnes': rows[tradeIndex.QUANTITY].map('{:,.0f}'.format)}),
+            striped=True, hover=True, size='sm'))
+    return children
+
+# source countries and foods listed for a country clicked in the At Risk Foods chart
+SOURCE_ROWS = 10
+
+
+# the clicked country's largest source countries and foods, read from the trade cube's slices for the country
+@app.callback(
+    Output('food-partner-sources', 'children'),
+    [Input('food-quadrant-chart', 'clickData')]
+)
+def update_clicked_partner(clickData):
+    if not clickData:
+        return html.P("Click a country's point to see where its imported food comes from.", style={'text-align': 'left'})
+    # the importing country's name is the first of each point's custom data (see staticFigures.risk_foods_chart)
+    partner = clickData['points'][0]['customdata'][0]
+    tonnes, items = foodCube.totals(partner)
+    tables = [dbc.Col(dbc.Table.from_dataframe(pd.DataFrame(rows, columns=[label, 'Tonnes']).assign(Tonnes=lambda df: df['Tonnes'].map('{:,.0f}'.format)),
+                                               striped=True, hover=True, size='sm'), md=6)
+              for label, rows in (('Top Source Countries', foodCube.sources(partner, SOURCE_ROWS)),
+                                  ('Top Foods Imported', foodCube.foods(partner, SOURCE_ROWS)))]
+    return [html.H6(f"{partner} imported {tonnes:,.0f} tonnes of {items:,} foods in 2019", style={'text-align': 'left'}),
+            dbc.Row(tables)]
 
 # connect the Learn More button and modal with user interactions
 
@@ -513,6 +776,14 @@ def toggle_modal(n1, n2, is_open):
         return not is_open
     return is_open
 
+
+startupProfile.mark('callbacks')
+# with gunicorn --preload the workers are forked from the process that loaded the app, sharing its memory until a page of
+# it is written; a garbage collection pass writes to every object it visits, so the objects loaded so far are moved out
+# of its reach, and their pages stay shared however many workers there are
+gc.freeze()
+startupProfile.report()
+
 # ----------------------------------------------------------------------------------------
 # run the app
 
@@ -0,0 +1,59 @@
+// client-side render timings of the soil map: for each callback response that updates the map (its whole figure after a
+// selection, or only its traces' arrays after a zoom or pan), the time from the response arriving to plotly finishing
+// drawing it, kept in window.soilMapTimings (the latest MAX_TIMINGS) and logged to the browser console, e.g. to compare
+// the two kinds of update; served only when the app is started with MAP_TIMINGS=1 (see app.py)
+(function () {
+    const MAX_TIMINGS = 500;
+    const timings = window.soilMapTimings = [];
+    let pending = null;
+
+    // note when a response to the map callback arrives, and whether it replaces the figure or restyles the traces
+    const fetch = window.fetch;
+    window.fetch = function (input, init) {
+        const response = fetch.apply(this, arguments);
+        const body = init && typeof init.body === 'string' ? init.body : '';
+        if (body.indexOf('map-socd-graph.figure') !== -1) {
+            response.then(function (received) {
+                if (received.status !== 200) {
+                    return;
+                }
+                const arrived = performance.now();
+                received.clone().text().then(function (text) {
+                    const update = JSON.parse(text).response || {};
+                    pending = {
+                        update: update['map-socd-graph'] ? 'figure' : 'restyle',
+                        bytes: text.length,
+                        arrived: arrived,
+                    };
+                });
+            });
+        }
+        return response;
+    };
+
+    // the draw that follows a response completes its timing
+    function afterplot() {
+        if (!pending || performance.now() - pending.arrived > 10000) {
+            pending = null;
+            return;
+        }
+        const timing = {update: pending.update, bytes: pending.bytes, render_ms: Math.round(performance.now() - pending.arrived)};
+        pending = null;
+        timings.push(timing);
+        if (timings.length > MAX_TIMINGS) {
+            timings.shift();
+        }
+        console.debug('soil map render', timing);
+    }
+
+    // listen to the map's plot once plotly has created it
+    const observer = new MutationObserver(function () {
+        const graph = document.getElementById('map-socd-graph');
+        const plot = graph && graph.querySelector('.js-plotly-plot');
+        if (plot && plot.on) {
+            plot.on('plotly_afterplot', afterplot);
+            observer.disconnect();
+        }
+    });
+    observer.observe(document.documentElement, {childList: true, subtree: true});
+})();
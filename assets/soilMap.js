@@ -0,0 +1,97 @@
+// clientside callbacks of the soil map (see app.py): restyling the points in view into the map after a zoom or pan,
+// and the optional MAP_CLIENTSIDE=1 mode, where a country's points arrive the first time it is selected, as base64
+// float32 arrays, and selecting it again swaps the map's traces in the browser without a server request
+
+// decoded arrays and extent by country, kept for the page, so switching back to a country requests and decodes nothing
+const soilMapDecoded = {};
+
+function soilMapDecode(text) {
+    const bytes = atob(text);
+    const buffer = new Uint8Array(bytes.length);
+    for (let i = 0; i < bytes.length; i++) {
+        buffer[i] = bytes.charCodeAt(i);
+    }
+    return new Float32Array(buffer.buffer);
+}
+
+// map center and zoom showing the extents (west, south, east, north) of the selected countries, as soilMap.country_view
+function soilMapView(extents, mapPixels) {
+    const west = Math.min(...extents.map(extent => extent[0]));
+    const south = Math.min(...extents.map(extent => extent[1]));
+    const east = Math.max(...extents.map(extent => extent[2]));
+    const north = Math.max(...extents.map(extent => extent[3]));
+    // the map is about twice as wide as it is tall; a mapbox map is 512 pixels wide for 360 degrees at zoom 0
+    const extent = Math.max(east - west, 2 * (north - south), 1);
+    const zoom = Math.min(Math.max(Math.log2(360 * mapPixels / (512 * extent)), 0), 10);
+    return {center: {lon: (west + east) / 2, lat: (south + north) / 2}, zoom: zoom};
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    soilMap: {
+        // the map's points in view after a zoom or pan, one set of arrays per selected country's trace, and the
+        // layout attributes following them (the legend's title naming the depth), updated in the existing plot
+        // rather than replacing its figure
+        restyleTrace: function (update) {
+            const graph = document.getElementById('map-socd-graph');
+            const plot = graph && graph.querySelector('.js-plotly-plot');
+            const traces = update && update.traces;
+            if (!traces || !traces.length || !plot || !window.Plotly) {
+                return window.dash_clientside.no_update;
+            }
+            window.Plotly.update(plot, {
+                lon: traces.map(trace => trace.lon),
+                lat: traces.map(trace => trace.lat),
+                'marker.size': traces.map(trace => trace.size),
+            }, update.layout || {}, traces.map((trace, i) => i));
+            return {points: traces.reduce((total, trace) => total + trace.lon.length, 0)};
+        },
+        selectCountry: function (selection, points, countryPoints) {
+            if (!points) {
+                return window.dash_clientside.no_update;
+            }
+            Object.entries(countryPoints || {}).forEach(function ([country, selected]) {
+                if (!soilMapDecoded[country]) {
+                    soilMapDecoded[country] = {
+                        lon: soilMapDecode(selected.lon),
+                        lat: soilMapDecode(selected.lat),
+                        size: soilMapDecode(selected.size),
+                        bounds: selected.bounds,
+                    };
+                }
+            });
+            const figure = points.figure;
+            // one country from an older session's single selection, or several
+            const known = [].concat(selection || []).filter(country => points.countries.includes(country));
+            if (known.some(country => !soilMapDecoded[country])) {
+                // a country's points are still on their way; the map is drawn when they arrive
+                return window.dash_clientside.no_update;
+            }
+            const countries = known.filter(country => soilMapDecoded[country].bounds);
+            if (!countries.length) {
+                // no selection (or the dropdown cleared) shows the empty map
+                return figure;
+            }
+            // the selected countries share the point budget, each thinned by the same step (as in soilIndex.py)
+            const total = countries.reduce((sum, country) => sum + soilMapDecoded[country].lon.length, 0);
+            const step = Math.max(Math.ceil(total / points.maxPoints), 1);
+            const thin = array => step > 1 ? array.filter((value, i) => i % step === 0) : array;
+            const data = countries.map(function (country, i) {
+                const arrays = soilMapDecoded[country];
+                return Object.assign({}, points.trace, {
+                    name: country,
+                    lon: thin(arrays.lon),
+                    lat: thin(arrays.lat),
+                    marker: Object.assign({}, points.trace.marker, {
+                        size: thin(arrays.size),
+                        color: points.colors[i % points.colors.length],
+                    }),
+                });
+            });
+            const layout = Object.assign({}, figure.layout, {
+                uirevision: countries.join(', '),  // keeps the user's zoom until the selection changes
+                mapbox: Object.assign({}, figure.layout.mapbox, soilMapView(countries.map(country => soilMapDecoded[country].bounds), points.mapPixels)),
+            });
+            return {data: data, layout: layout};
+        },
+    },
+});
@@ -0,0 +1,42 @@
+# ----------------------------------------------------------------------------------------
+# peak memory and time of the country-level soil statistics, before and after the single-pass aggregate
+#
+# before: the mean broadcast back onto every soil point with transform, then drop_duplicates and a multi-key sort
+# after: countryStats.country_stats, one groupby aggregate to a table of one row per country
+# peak memory is what Python's tracemalloc sees allocated above the loaded dataframe, which includes NumPy's arrays
+# run from the project's root directory with:
+#   python -m benchmarks.countryStats
+
+import json
+import time
+import tracemalloc
+import countryStats
+import dataStore
+
+
+# the previous density ranges bar chart preparation
+def broadcast_means(dfsoil):
+    dfsoil = dfsoil.copy(deep=False)
+    dfsoil['SOCDcountryMean'] = dfsoil['Reporter_Country_SOCD_depth4_5'].groupby(dfsoil['Reporter_Country_name']).transform('mean')
+    return dfsoil.drop_duplicates(subset=['Reporter_Country_name', 'Reporter_Country_continent', 'SOCDcountryMean', 'Reporter_Country_pop_est']).drop(['Reporter_Country_SOCD_depth4_5'], axis=1).sort_values(by=['SOCDcountryMean', 'Reporter_Country_continent', 'Reporter_Country_name'], ascending=(False, True, True))
+
+
+def measure(name, aggregate, dfsoil):
+    tracemalloc.start()
+    start = time.perf_counter()
+    table = aggregate(dfsoil)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'variant': name, 'rows_in': len(dfsoil), 'rows_out': len(table),
+            'seconds': round(seconds, 3), 'peak_mb': round(peak / 1e6, 1)}
+
+
+def main():
+    dfsoil = dataStore.load_soil()
+    print(json.dumps(measure('before', broadcast_means, dfsoil)))
+    print(json.dumps(measure('after', countryStats.country_stats, dfsoil)))
+
+
+if __name__ == '__main__':
+    main()
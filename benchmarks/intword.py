@@ -0,0 +1,55 @@
+# ----------------------------------------------------------------------------------------
+# benchmark of humanFormat.intword against humanize.intword
+#
+# times labelling a column the size of the trade matrix both ways, from numbers drawn as the app's quantities and
+# populations are: non-negative, spanning every power of a thousand (log-uniformly from 1 to 10^19, so every suffix
+# is drawn about equally often), with the edges where a label rounds up to the next power (e.g. 999,950 as
+# '1.0 million'); the labels are checked against humanize's by the tests (tests/test_intword.py)
+# run from the project's root directory with:
+#   python -m benchmarks.intword [--samples 200000] [--seed 0]
+
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+import humanize
+import humanFormat
+
+
+def sample(rng, n):
+    edges = []
+    for exponent in range(3, 21, 3):
+        power = 10 ** exponent
+        # just under, at and just over each power, and around the rounding edge 999.95 of the power below it
+        edges += [power - 1, power, power + 1, power * 0.99995, power * 0.9999499, power * 0.9999501]
+    return np.concatenate([
+        10 ** rng.uniform(0, 19, n),
+        np.floor(10 ** rng.uniform(0, 19, n)),
+        rng.uniform(0, 5000, n // 10),
+        [0.0, 0.4, 999.0, 999.99],
+        edges,
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time humanFormat.intword against humanize.intword.')
+    parser.add_argument('--samples', type=int, default=200000, help='random values drawn per distribution')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    # a column the size of the trade matrix repeating a few hundred partner totals, as in the app
+    column = pd.Series(rng.choice(sample(rng, args.samples)[:300], 750000))
+    start = time.perf_counter()
+    column.apply(lambda x: humanize.intword(x))
+    apply_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    humanFormat.intword(column)
+    vectorized_seconds = time.perf_counter() - start
+
+    print(json.dumps({'rows': len(column), 'apply_seconds': round(apply_seconds, 3), 'intword_seconds': round(vectorized_seconds, 3)}))
+
+
+if __name__ == '__main__':
+    main()
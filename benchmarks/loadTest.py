@@ -0,0 +1,381 @@
+# ----------------------------------------------------------------------------------------
+# load test of the app under gunicorn: concurrent virtual users replaying a browser's callback requests to
+# /_dash-update-component, reporting latency percentiles, throughput and the workers' resident memory over time
+#
+# each virtual user plays sessions of a visitor: load the page (every callback's initial call), select a country,
+# zoom into the map a few times, and now and then change the SOCD depth, add a second country or click an importing
+# country of the At Risk Foods chart; like Dash's renderer, a changed property fires the server callbacks it is an
+# input of, with their state, and the properties in each response feed the requests that follow (e.g. the map's view
+# store); the callbacks and the page's initial properties are read from the app's own /_dash-dependencies and
+# /_dash-layout, and no browser, mapbox or tile server is involved, since map tiles are only fetched by a browser
+# gunicorn is started here with --preload (as in the Procfile) on the project's data, or on a scale of the benchmark
+# suite's synthetic data with --points; or the test drives a server already running with --url (and --pid, its
+# gunicorn master's process id, for the workers' memory); run from the project's root directory with:
+#   python -m benchmarks.loadTest [--workers 2] [--users 8] [--duration 60] [--points 1000000]
+
+import argparse
+import copy
+import datetime
+import gzip
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+from benchmarks import suite
+
+CALLBACK_PATH = '/_dash-update-component'
+DROPDOWN = 'reporter_country_dropdown'
+DEPTH_DROPDOWN = 'socd_depth_dropdown'
+MAP = 'map-socd-graph'
+CHART = 'food-quadrant-chart'
+# the map's size in the browser, in pixels, for the bounds of a zoomed view
+MAP_PIXELS = (900, 450)
+MAX_ZOOM = 12
+PAGE_BYTES = os.sysconf('SC_PAGE_SIZE')
+
+
+# the app's server callbacks and the page's initial properties, as the browser reads them when the page loads
+class App:
+    def __init__(self, url):
+        self.url = url
+        # clientside callbacks run in the browser, and are left out
+        self.callbacks = [callback for callback in get_json(url + '/_dash-dependencies') if not callback.get('clientside_function')]
+        self.props = {}
+        layout_props(get_json(url + '/_dash-layout'), self.props)
+
+    # the server callbacks a changed property is an input of
+    def triggered_by(self, prop_id):
+        return [callback for callback in self.callbacks
+                if prop_id in (f"{i['id']}.{i['property']}" for i in callback['inputs'])]
+
+
+# every component's properties in a layout, by id
+def layout_props(node, props):
+    if isinstance(node, list):
+        for child in node:
+            layout_props(child, props)
+    elif isinstance(node, dict) and 'props' in node:
+        if 'id' in node['props']:
+            props[node['props']['id']] = node['props']
+        layout_props(node['props'].get('children'), props)
+
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return json.load(response)
+
+
+# Dash's outputs of a callback, from its output string, e.g. '..a.b...c.d..' for two outputs or 'a.b' for one
+def outputs(output):
+    if output.startswith('..'):
+        return [dict(zip(('id', 'property'), part.rsplit('.', 1))) for part in output[2:-2].split('...')]
+    return dict(zip(('id', 'property'), output.rsplit('.', 1)))
+
+
+# the requests' latencies, statuses and response sizes, shared by the virtual users
+class Recorder:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.records = []  # (seconds since start when finished, callback, latency seconds, HTTP status, bytes)
+        self.lock = threading.Lock()
+
+    def add(self, callback, seconds, status, size):
+        with self.lock:
+            self.records.append((time.perf_counter() - self.started, callback, seconds, status, size))
+
+
+# a virtual user's page: its components' properties, updated from the callbacks' responses
+class Session:
+    def __init__(self, app, recorder, rng):
+        self.app, self.recorder, self.rng = app, recorder, rng
+        self.props = copy.deepcopy(app.props)
+        self.center, self.zoom = None, None
+
+    def value(self, component, prop):
+        return self.props.get(component, {}).get(prop)
+
+    # post one callback's request, as the browser does, and apply the properties of its response
+    def call(self, callback, changed):
+        request = {
+            'output': callback['output'],
+            'outputs': outputs(callback['output']),
+            'inputs': [dict(i, value=self.value(i['id'], i['property'])) for i in callback['inputs']],
+            'state': [dict(s, value=self.value(s['id'], s['property'])) for s in callback['state']],
+            'changedPropIds': changed,
+        }
+        post = urllib.request.Request(self.app.url + CALLBACK_PATH, data=json.dumps(request).encode(),
+                                      headers={'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(post, timeout=300) as response:
+                status, body = response.status, response.read()
+                encoding = response.headers.get('Content-Encoding')
+        except urllib.error.HTTPError as error:
+            status, body, encoding = error.code, error.read(), None
+        self.recorder.add(callback['output'], time.perf_counter() - start, status, len(body))
+        if status != 200:
+            # 204: the callback raised PreventUpdate
+            return []
+        updated = json.loads(gzip.decompress(body) if encoding == 'gzip' else body).get('response', {})
+        for component, props in updated.items():
+            self.props.setdefault(component, {}).update(props)
+        return [f'{component}.{prop}' for component, props in updated.items() for prop in props]
+
+    # every server callback's initial call when the page loads
+    def load(self):
+        for callback in self.app.callbacks:
+            if not callback.get('prevent_initial_call'):
+                self.call(callback, [])
+        self.map_view()
+
+    # a property changed by the user, firing the server callbacks it is an input of, and those of the properties
+    # they update in turn
+    def change(self, component, prop, value):
+        self.props.setdefault(component, {})[prop] = value
+        changed = [f'{component}.{prop}']
+        while changed:
+            prop_id = changed.pop(0)
+            for callback in self.app.triggered_by(prop_id):
+                changed.extend(self.call(callback, [prop_id]))
+
+    # the map's center and zoom as drawn, from its figure
+    def map_view(self):
+        mapbox = (self.value(MAP, 'figure') or {}).get('layout', {}).get('mapbox', {})
+        center = mapbox.get('center') or {}
+        self.center = (center.get('lon', 0), center.get('lat', 0))
+        self.zoom = mapbox.get('zoom', 1)
+
+    def countries(self):
+        return option_values(self.value(DROPDOWN, 'options'))
+
+    def select(self, countries):
+        self.change(DROPDOWN, 'value', countries)
+        self.map_view()
+
+    # zoom in around a point near the map's center, sending the relayout data Plotly's mapbox sends
+    def zoom_in(self):
+        zoom = min(self.zoom + self.rng.choice((1, 2, 3)), MAX_ZOOM)
+        width = MAP_PIXELS[0] * 360 / (512 * 2 ** zoom)
+        height = width * MAP_PIXELS[1] / MAP_PIXELS[0]
+        lon = self.center[0] + self.rng.uniform(-1, 1) * width / 2
+        lat = max(min(self.center[1] + self.rng.uniform(-1, 1) * height / 2, 85), -85)
+        corners = [[lon - width / 2, lat + height / 2], [lon + width / 2, lat + height / 2],
+                   [lon + width / 2, lat - height / 2], [lon - width / 2, lat - height / 2]]
+        self.change(MAP, 'relayoutData', {'mapbox.center': {'lon': lon, 'lat': lat}, 'mapbox.zoom': zoom,
+                                          'mapbox.bearing': 0, 'mapbox.pitch': 0, 'mapbox._derived': {'coordinates': corners}})
+        self.center, self.zoom = (lon, lat), zoom
+
+    def change_depth(self):
+        others = [depth for depth in option_values(self.value(DEPTH_DROPDOWN, 'options')) if depth != self.value(DEPTH_DROPDOWN, 'value')]
+        if others:
+            self.change(DEPTH_DROPDOWN, 'value', self.rng.choice(others))
+
+    # click a point of the At Risk Foods chart, whose custom data names its importing country
+    def click_chart(self):
+        points = [{'curveNumber': i, 'customdata': row} for i, trace in enumerate((self.value(CHART, 'figure') or {}).get('data', []))
+                  for row in trace.get('customdata') or []]
+        if points:
+            self.change(CHART, 'clickData', {'points': [self.rng.choice(points)]})
+
+
+# a dropdown's option values, from options given as {'label', 'value'} dicts or as the values themselves
+def option_values(options):
+    return [option['value'] if isinstance(option, dict) else option for option in options or []]
+
+
+# a virtual user's sessions, one after another until the deadline, with think time between steps
+def user(app, recorder, seed, deadline, think):
+    rng = random.Random(seed)
+
+    def steps(session):
+        countries = session.countries()
+        yield session.load
+        yield lambda: session.select([rng.choice(countries)])
+        for _ in range(rng.randint(0, 3)):
+            yield session.zoom_in
+        if rng.random() < 0.3:
+            yield session.change_depth
+        if rng.random() < 0.3:
+            yield lambda: session.select(session.value(DROPDOWN, 'value') + [rng.choice(countries)])
+        if rng.random() < 0.5:
+            yield session.click_chart
+
+    while time.perf_counter() < deadline:
+        for step in steps(Session(app, recorder, rng)):
+            if time.perf_counter() >= deadline:
+                return
+            step()
+            if think:
+                time.sleep(rng.expovariate(1 / think))
+
+
+# ----------------------------------------------------------------------------------------
+# the resident memory (RSS) and proportional set size (PSS, with shared pages divided among the processes sharing
+# them) of a gunicorn master's workers, in MB, read from /proc on Linux
+def workers(master):
+    pids = []
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                # the parent's pid is the second field after the process name, which may contain spaces
+                if int(f.read().rsplit(')', 1)[1].split()[1]) == master:
+                    pids.append(int(pid))
+        except (OSError, IndexError, ValueError):
+            pass
+    return sorted(pids)
+
+
+def memory_mb(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            rss = int(f.read().split()[1]) * PAGE_BYTES / 1e6
+        pss = None
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    pss = int(line.split()[1]) * 1024 / 1e6
+        return {'pid': pid, 'rss_mb': round(rss, 1), 'pss_mb': None if pss is None else round(pss, 1)}
+    except OSError:
+        return None
+
+
+# samples every interval from the start of the load, and once more when it stops, so even a run shorter than an
+# interval ends with its workers' memory
+def sample_memory(master, recorder, interval, samples, stop):
+    while True:
+        samples.append({'seconds': round(time.perf_counter() - recorder.started, 1),
+                        'workers': list(filter(None, map(memory_mb, workers(master))))})
+        if stop.is_set():
+            return
+        stop.wait(interval)
+
+
+# ----------------------------------------------------------------------------------------
+# gunicorn serving the app from a directory (its data below data/), with the project's modules importable
+def start_server(directory, app, workers_count, port):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [suite.ROOT, os.environ.get('PYTHONPATH')])))
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', app, '--preload', '--workers', str(workers_count),
+                               '--bind', f'127.0.0.1:{port}', '--timeout', '300'],
+                              cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    url = f'http://127.0.0.1:{port}'
+    start = time.perf_counter()
+    while True:
+        if server.poll() is not None:
+            sys.exit(f"gunicorn exited while starting:\n{server.stderr.read()}")
+        try:
+            get_json(url + '/_dash-dependencies')
+            print(f"gunicorn with {workers_count} workers serving {directory} at {url}, "
+                  f"started in {time.perf_counter() - start:.0f} s", file=sys.stderr)
+            return server, url
+        except OSError:
+            time.sleep(0.5)
+
+
+def percentiles_ms(seconds):
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) * 1000 if len(seconds) else (0, 0, 0)
+    return {'p50_ms': round(p50, 1), 'p95_ms': round(p95, 1), 'p99_ms': round(p99, 1)}
+
+
+# the run's totals, each callback's, and a timeline of the throughput and latency between samples and the memory at each
+# (the last span, up to the sample taken as the load stopped, may be shorter than the interval)
+def summarize(records, samples, duration):
+    def stats(rows, seconds):
+        return {'requests': len(rows), 'requests_per_second': round(len(rows) / seconds, 2) if seconds else 0,
+                'errors': sum(status >= 400 for _, _, _, status, _ in rows),
+                # callbacks that raised PreventUpdate, e.g. a zoom inside the map points already drawn
+                'prevented': sum(status == 204 for _, _, _, status, _ in rows),
+                'mean_bytes': round(np.mean([size for *_, size in rows])) if rows else 0,
+                **percentiles_ms([latency for _, _, latency, _, _ in rows])}
+
+    callbacks = sorted({callback for _, callback, *_ in records})
+    timeline = []
+    for previous, sample in zip(samples, samples[1:]):
+        rows = [record for record in records if previous['seconds'] <= record[0] < sample['seconds']]
+        workers = sample['workers']
+        timeline.append({'seconds': sample['seconds'], **stats(rows, sample['seconds'] - previous['seconds']),
+                         'rss_mb': round(sum(worker['rss_mb'] for worker in workers), 1),
+                         'pss_mb': round(sum(worker['pss_mb'] or 0 for worker in workers), 1),
+                         'workers': workers})
+    return {'total': stats(records, duration),
+            'callbacks': {callback: stats([record for record in records if record[1] == callback], duration) for callback in callbacks},
+            'timeline': timeline}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the app's Dash callbacks with concurrent virtual users.")
+    parser.add_argument('--users', type=int, default=8, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='seconds of load')
+    parser.add_argument('--think', type=float, default=0, help="mean seconds a user waits between steps (0 for none, the server's ceiling)")
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--app', default='app:server', help='WSGI application for gunicorn')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--points', type=int, help="serve a scale of the benchmark suite's synthetic data instead of the project's data")
+    parser.add_argument('--trade-rows', type=int, default=500000)
+    parser.add_argument('--url', help='drive a server already running instead of starting gunicorn')
+    parser.add_argument('--pid', type=int, help="with --url, the gunicorn master's process id, for its workers' memory")
+    parser.add_argument('--interval', type=float, default=5, help='seconds between samples of throughput, latency and memory')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file (default bench_output/loadtest-<commit>.json)')
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url, master = args.url.rstrip('/'), args.pid
+    else:
+        directory = suite.prepare(args.points, args.trade_rows, args.seed) if args.points else suite.ROOT
+        server, url = start_server(directory, args.app, args.workers, args.port)
+        master = server.pid
+    try:
+        app = App(url)
+        recorder = Recorder()
+        samples, stop = [], threading.Event()
+        sampler = threading.Thread(target=sample_memory, args=(master, recorder, args.interval, samples, stop), daemon=True)
+        if master:
+            sampler.start()
+        deadline = recorder.started + args.duration
+        users = [threading.Thread(target=user, args=(app, recorder, args.seed * 1000 + i, deadline, args.think))
+                 for i in range(args.users)]
+        for thread in users:
+            thread.start()
+        for thread in users:
+            thread.join()
+        duration = time.perf_counter() - recorder.started
+        stop.set()
+        if master:
+            sampler.join()
+    finally:
+        if server:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+    commit, dirty = suite.git_commit()
+    results = {'commit': commit, 'dirty': dirty, 'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+               'url': url, 'workers': args.workers if server else None, 'users': args.users, 'think': args.think,
+               'points': args.points, 'duration': round(duration, 1),
+               **summarize(recorder.records, samples, duration)}
+    os.makedirs(suite.OUTPUT_DIR, exist_ok=True)
+    output = args.output or os.path.join(suite.OUTPUT_DIR, f'loadtest-{commit}{"-dirty" if dirty else ""}.json')
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    total = results['total']
+    print(f"{total['requests']:,} requests in {duration:.0f} s by {args.users} users: {total['requests_per_second']:.1f} requests/s, "
+          f"p50 {total['p50_ms']:.0f} ms, p95 {total['p95_ms']:.0f} ms, p99 {total['p99_ms']:.0f} ms, {total['errors']} errors")
+    for callback, stats in results['callbacks'].items():
+        print(f"  {callback:<72} {stats['requests']:>7,} {stats['p50_ms']:>8.0f} {stats['p95_ms']:>8.0f} {stats['p99_ms']:>8.0f} ms {stats['mean_bytes']:>11,} B")
+    print(f"{'seconds':>8} {'req/s':>8} {'p95 ms':>8} {'RSS MB':>8} {'PSS MB':>8}  workers' RSS MB")
+    for row in results['timeline']:
+        print(f"{row['seconds']:>8.0f} {row['requests_per_second']:>8.1f} {row['p95_ms']:>8.0f} {row['rss_mb']:>8.0f} {row['pss_mb']:>8.0f}  "
+              + ' '.join(f"{worker['rss_mb']:.0f}" for worker in row['workers']))
+    print(f"results -> {output}")
+
+
+if __name__ == '__main__':
+    main()
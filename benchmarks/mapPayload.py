@@ -0,0 +1,60 @@
+# ----------------------------------------------------------------------------------------
+# regression check of the map callback's response payload size
+#
+# posts a dropdown selection to the app's /_dash-update-component endpoint, the same request the browser makes,
+# and checks the serialized response stays within a fixed overhead plus a budget per point drawn; a response
+# that carries anything proportional to the global dataset (e.g. the unfiltered SOCD column) fails it, and the
+# points drawn are themselves bounded by the map's level of detail (soilIndex.MAX_POINTS)
+# run from the project's root directory with:
+#   python -m benchmarks.mapPayload [--country Kenya [--country China ...]]
+# and run on a small synthetic dataset by the tests (tests/test_map_payload.py)
+
+import argparse
+import json
+import sys
+
+# bytes allowed for the figure layout, trace settings and Dash response envelope
+OVERHEAD_BYTES = 4000
+# bytes allowed per point: lon, lat and size at their encoded precision, e.g. "-100.5833,", "38.4167,", "27.3,"
+BYTES_PER_POINT = 32
+
+
+def map_request(countries):
+    return {
+        'output': '..map-socd-graph.figure...map-socd-trace.data...map-socd-view.data..',
+        'outputs': [{'id': 'map-socd-graph', 'property': 'figure'}, {'id': 'map-socd-trace', 'property': 'data'},
+                    {'id': 'map-socd-view', 'property': 'data'}],
+        'inputs': [{'id': 'reporter_country_dropdown', 'property': 'value', 'value': countries},
+                   {'id': 'socd_depth_dropdown', 'property': 'value', 'value': 4.5},
+                   {'id': 'map-socd-graph', 'property': 'relayoutData', 'value': None}],
+        'state': [{'id': 'map-socd-view', 'property': 'data', 'value': None}],
+        'changedPropIds': ['reporter_country_dropdown.value'],
+    }
+
+
+# the response to a selection of countries, posted to the app's test client, and the payload budget of the points drawn
+# at the level of detail fitting the whole selection into view, as a selection is first shown
+def measure(app, countries):
+    level = app.soilPoints.level_for(countries, app.soilMap.country_view(app.soilPoints, countries)['zoom'])
+    points = sum(len(selected['lon']) for selected in app.soilPoints.select(countries, level))
+    response = app.server.test_client().post('/_dash-update-component', json=map_request(countries))
+    return {'countries': countries, 'points': points, 'status': response.status_code,
+            'payload_bytes': len(response.get_data()), 'budget_bytes': OVERHEAD_BYTES * len(countries) + BYTES_PER_POINT * points}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the map callback response size for a sample selection of countries.')
+    parser.add_argument('--country', action='append', help='sample trade partner country to select, repeated to select several (default Kenya)')
+    args = parser.parse_args()
+    countries = args.country or ['Kenya']
+
+    import app
+
+    result = measure(app, countries)
+    print(json.dumps(result))
+    if result['status'] != 200 or result['payload_bytes'] > result['budget_bytes']:
+        sys.exit(f"map payload for {', '.join(countries)} is over budget: {result['payload_bytes']:,} > {result['budget_bytes']:,} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# ----------------------------------------------------------------------------------------
+# before/after measurement of the At Risk Foods scatterplot
+#
+# before: one point per trade row, with each partner country's totals broadcast onto all of its rows by transform
+# after: one point per partner country, from the groupby aggregate summary (staticFigures.risk_foods_summary)
+#
+# reports build time and serialized figure JSON size, and writes a standalone HTML page per variant that measures its
+# time to first paint (from page navigation start to the frame after plotly finishes drawing): the page reloads itself
+# --reloads times, then shows the median and each load's time in the page title and browser console; open both pages
+# in a browser to compare them
+# run from the project's root directory with:
+#   python -m benchmarks.riskFoodsFigure [--out bench_output] [--reloads 7]
+
+import argparse
+import json
+import os
+import time
+import plotly
+import plotly.io as pio
+import dataStore
+import staticFigures
+
+# runs after Plotly.newPlot resolves; the next animation frame is the first one painted with the chart, and the times of
+# the loads so far are kept in the tab's session storage until there are RELOADS of them
+FIRST_PAINT = """
+requestAnimationFrame(function () {
+    var key = 'firstPaint:' + location.pathname;
+    var times = JSON.parse(sessionStorage.getItem(key) || '[]');
+    times.push(Math.round(performance.now()));
+    if (times.length < RELOADS) {
+        sessionStorage.setItem(key, JSON.stringify(times));
+        location.reload();
+        return;
+    }
+    sessionStorage.removeItem(key);
+    var median = times.slice().sort(function (a, b) { return a - b; })[Math.floor(times.length / 2)];
+    document.title = 'first paint ' + median + ' ms (median of ' + times.join(', ') + ')';
+    console.log('time to first paint: median ' + median + ' ms of ' + times.join(', ') + ' ms');
+});
+"""
+
+
+# the previous chart source: every trade row, carrying its partner country's totals
+def row_level_source(dffood):
+    dffoodRows = dffood[['Partner_Country_name', 'Item', 'Export_Quantity_2019_Value_tonnes']].copy()
+    dffoodRows['Export_Quantity_Sum'] = dffoodRows['Export_Quantity_2019_Value_tonnes'].groupby(dffoodRows['Partner_Country_name']).transform('sum')
+    dffoodRows['Export_Items_Count'] = dffoodRows['Item'].groupby(dffoodRows['Partner_Country_name']).transform('nunique')
+    return dffoodRows
+
+
+def measure(name, make_source, dffood, out, reloads):
+    start = time.perf_counter()
+    source = make_source(dffood)
+    fig = staticFigures.risk_foods_chart(source)
+    figure_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+    seconds = time.perf_counter() - start
+    page = os.path.join(out, f'riskFoods-{name}.html')
+    pio.write_html(fig, page, include_plotlyjs=True, post_script=FIRST_PAINT.replace('RELOADS', str(reloads)))
+    return {'variant': name, 'points': len(source), 'build_seconds': round(seconds, 3),
+            'figure_json_bytes': len(figure_json), 'page': page}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the row-level and per-partner At Risk Foods figures.')
+    parser.add_argument('--out', default='bench_output', help='directory for the first paint HTML pages')
+    parser.add_argument('--reloads', type=int, default=7, help='page loads timed for the median first paint')
+    args = parser.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+
+    dffood = dataStore.load_food()
+    for result in (measure('before', row_level_source, dffood, args.out, args.reloads),
+                   measure('after', staticFigures.risk_foods_summary, dffood, args.out, args.reloads)):
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# ----------------------------------------------------------------------------------------
+# startup-time benchmark: CSV vs columnar store loads of the app's datasets
+#
+# each load runs in a fresh Python process, the same as a gunicorn boot, so that wall time and peak memory (RSS)
+# are not flattered by a warm interpreter; build the columnar store first with `python dataStore.py`, then
+# run from the project's root directory with:
+#   python -m benchmarks.startupLoad [--repeat 3]
+
+import argparse
+import json
+import subprocess
+import sys
+
+# a load is timed inside the child process, and its peak RSS is read from the kernel's accounting for that process
+# (see startupProfile.peak_rss_mb)
+CHILD = """
+import json, time
+import dataStore
+import startupProfile
+start = time.perf_counter()
+df = {load}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds,
+                  'rows': len(df),
+                  'memory_mb': df.memory_usage(deep=True).sum() / 1e6,
+                  'peak_rss_mb': startupProfile.peak_rss_mb()}}))
+"""
+
+LOADS = {
+    'food csv': "dataStore.read_csv(dataStore.FOOD_CSV, dataStore.FOOD_DTYPES)",
+    'food store': "dataStore.pd.read_parquet(dataStore.FOOD_STORE)",
+    'soil csv': "dataStore.read_csv(dataStore.SOIL_CSV, dataStore.SOIL_DTYPES)",
+    'soil store': "dataStore.pd.read_parquet(dataStore.SOIL_STORE)",
+}
+
+
+def run(load):
+    out = subprocess.run([sys.executable, '-c', CHILD.format(load=load)],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time CSV vs columnar store loads of the app datasets.')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh processes per load path (best time is kept)')
+    args = parser.parse_args()
+
+    results = {}
+    for name, load in LOADS.items():
+        runs = [run(load) for _ in range(args.repeat)]
+        results[name] = min(runs, key=lambda r: r['seconds'])
+        print(f"{name:<12} {results[name]['seconds']:8.2f} s  "
+              f"peak RSS {results[name]['peak_rss_mb']:8.1f} MB  "
+              f"frame {results[name]['memory_mb']:8.1f} MB  "
+              f"({results[name]['rows']:,} rows)")
+
+    for dataset in ('food', 'soil'):
+        speedup = results[f'{dataset} csv']['seconds'] / results[f'{dataset} store']['seconds']
+        print(f"{dataset}: columnar store loads {speedup:.1f}x faster than CSV")
+
+
+if __name__ == '__main__':
+    main()
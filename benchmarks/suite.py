@@ -0,0 +1,242 @@
+# ----------------------------------------------------------------------------------------
+# benchmark suite of the app's data loading, aggregations and map callback on synthetic data at several scales
+#
+# for each scale, synthetic soil and food trade CSV files (see benchmarks/syntheticData.py) are written once to
+# bench_output/synthetic-<points>-<trade rows>/data, and its columnar store, soil point index and trade cube and index
+# are built there, then every measurement runs in a fresh Python process in that directory, as app.py would at boot:
+#   load:      CSV vs columnar store reads of each dataset (wall time and peak RSS)
+#   aggregate: the country soil statistics (the country-mean aggregation), the trade aggregation per importer of the
+#              At Risk Foods chart, the trade cube and trade index, and the soil point pyramid
+#   map:       update_selected_reporter_country through Dash's callback endpoint for the huge, medium and small
+#              country (by points), as a first selection (figure cache empty), a repeat selection (cached) and a zoom
+# results are written as one JSON file per commit, whose flat "metrics" of each scale compare directly across commits
+# run from the project's root directory with:
+#   python -m benchmarks.suite [--points 100000 1000000 10000000] [--trade-rows 500000] [--repeat 3] [--baseline FILE]
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(ROOT, 'bench_output')
+# the map zoom of the benchmark's zoom request, a region of a country at about city scale
+ZOOM = 8
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak * 1024 / 1e6
+
+
+# the best of repeat runs of a function, in seconds, with its last result
+def best(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+# ----------------------------------------------------------------------------------------
+# measurements, each run in its own process with the working directory of a scale's synthetic data
+def measure_load(name, repeat):
+    import dataStore
+    loads = {
+        'food csv': lambda: dataStore.read_csv(dataStore.FOOD_CSV, dataStore.FOOD_DTYPES),
+        'food store': lambda: dataStore.pd.read_parquet(dataStore.FOOD_STORE),
+        'soil csv': lambda: dataStore.read_csv(dataStore.SOIL_CSV, dataStore.SOIL_DTYPES),
+        'soil store': lambda: dataStore.load_soil(),
+    }
+    seconds, df = best(loads[name], repeat)
+    return {'seconds': seconds, 'rows': len(df), 'peak_rss_mb': peak_rss_mb()}
+
+
+def measure_aggregate(repeat):
+    import countryStats
+    import dataStore
+    import soilIndex
+    import staticFigures
+    import tradeCube
+    import tradeIndex
+    dfsoil, dffood = dataStore.load_soil(), dataStore.load_food()
+    aggregations = {
+        'country stats': lambda: countryStats.country_stats(dfsoil),
+        'trade summary': lambda: staticFigures.risk_foods_summary(dffood),
+        'trade cube': lambda: tradeCube.TradeCube.from_frame(dffood),
+        'trade index': lambda: tradeIndex.TradeIndex.from_frame(dffood),
+        'soil pyramid': lambda: soilIndex.SoilPyramid.from_index(soilIndex.SoilPointIndex.from_frame(dfsoil)),
+    }
+    return {name: {'seconds': best(aggregate, repeat)[0]} for name, aggregate in aggregations.items()}
+
+
+def map_request(countries, relayoutData=None, view=None):
+    return {
+        'output': '..map-socd-graph.figure...map-socd-trace.data...map-socd-view.data..',
+        'outputs': [{'id': 'map-socd-graph', 'property': 'figure'}, {'id': 'map-socd-trace', 'property': 'data'},
+                    {'id': 'map-socd-view', 'property': 'data'}],
+        'inputs': [{'id': 'reporter_country_dropdown', 'property': 'value', 'value': countries},
+                   {'id': 'socd_depth_dropdown', 'property': 'value', 'value': 4.5},
+                   {'id': 'map-socd-graph', 'property': 'relayoutData', 'value': relayoutData}],
+        'state': [{'id': 'map-socd-view', 'property': 'data', 'value': view}],
+        'changedPropIds': ['map-socd-graph.relayoutData' if relayoutData else 'reporter_country_dropdown.value'],
+    }
+
+
+def measure_map(repeat):
+    import app
+    import figureCache
+    client = app.server.test_client()
+
+    def post(request):
+        response = client.post('/_dash-update-component', json=request)
+        assert response.status_code == 200, response.status_code
+        return response.get_data()
+
+    # the countries with the most and the fewest points, and the one in between on a log scale
+    counts = {country: app.soilPoints.count(country, 0) for country in app.soilPoints.countries}
+    huge, small = max(counts, key=counts.get), min(counts, key=counts.get)
+    middle = (counts[huge] * max(counts[small], 1)) ** 0.5
+    sizes = {'huge': huge, 'medium': min(counts, key=lambda country: abs(counts[country] - middle)), 'small': small}
+    results = {}
+    for size, country in sizes.items():
+        def first():
+            app.mapFigures = figureCache.FigureCache()
+            return post(map_request([country]))
+        select_seconds, payload = best(first, repeat)
+        cached_seconds, _ = best(lambda: post(map_request([country])), repeat)
+        # a window about 900 x 450 pixels wide at the zoom, around the country's first point
+        lon, lat = (float(app.soilPoints.levels[0].slice(country)[key][0]) for key in ('lon', 'lat'))
+        width = 900 * 360 / (512 * 2 ** ZOOM)
+        corners = [[lon - width / 2, lat + width / 4], [lon + width / 2, lat + width / 4],
+                   [lon + width / 2, lat - width / 4], [lon - width / 2, lat - width / 4]]
+        # without the view state of a previous response, so the window's points are always queried and sent
+        zoom_seconds, zoom_payload = best(lambda: post(map_request([country], {'mapbox.zoom': ZOOM, 'mapbox._derived': {'coordinates': corners}})), repeat)
+        results[size] = {'country': country, 'points': app.soilPoints.count(country, 0),
+                         'select_seconds': select_seconds, 'select_bytes': len(payload),
+                         'cached_seconds': cached_seconds,
+                         'zoom_seconds': zoom_seconds, 'zoom_bytes': len(zoom_payload)}
+    return results
+
+
+MEASURES = {
+    'load': measure_load,
+    'aggregate': measure_aggregate,
+    'map': measure_map,
+}
+
+
+# ----------------------------------------------------------------------------------------
+# run a measurement in a fresh process in a scale's directory, with the project's modules importable
+def run(directory, measure, *arguments):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])),
+               MAP_CACHE_PREWARM='0', STARTUP_PROFILE='0')
+    child = subprocess.run([sys.executable, '-m', 'benchmarks.suite', '--measure', measure, *map(str, arguments)],
+                           cwd=directory, env=env, capture_output=True, text=True)
+    if child.returncode:
+        sys.exit(f"{measure} measurement failed in {directory}:\n{child.stderr}")
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+# a scale's synthetic data directory, generated once for each set of parameters, and built again whenever its build
+# is not current with the code being benchmarked (see dataStore.built_version)
+def prepare(points, trade_rows, seed):
+    from benchmarks import syntheticData
+    directory = os.path.join(OUTPUT_DIR, f'synthetic-{points}-{trade_rows}')
+    parameters = {'points': points, 'trade_rows': trade_rows, 'seed': seed}
+    marker = os.path.join(directory, 'parameters.json')
+    generated = False
+    if os.path.exists(marker):
+        with open(marker) as f:
+            generated = json.load(f) == parameters
+    start = time.perf_counter()
+    if not generated:
+        syntheticData.generate(directory, points, trade_rows, seed=seed)
+        with open(marker, 'w') as f:
+            json.dump(parameters, f)
+    subprocess.run([sys.executable, '-c', 'import dataStore; dataStore.built_version() or dataStore.build()'], cwd=directory,
+                   check=True, capture_output=True, env=dict(os.environ, PYTHONPATH=ROOT))
+    if not generated:
+        print(f"synthetic data with {points:,} points and {trade_rows:,} trade rows -> {directory} "
+              f"in {time.perf_counter() - start:.0f} s", file=sys.stderr)
+    return directory
+
+
+def benchmark(points, trade_rows, repeat, seed):
+    directory = prepare(points, trade_rows, seed)
+    results = {'points': points, 'trade_rows': trade_rows,
+               'load': {name: run(directory, 'load', repeat, name) for name in ('food csv', 'food store', 'soil csv', 'soil store')},
+               'aggregate': run(directory, 'aggregate', repeat),
+               'map': run(directory, 'map', repeat)}
+    # every number of the scale as one flat name -> value table, e.g. "load.soil csv.seconds"
+    results['metrics'] = {f'{group}.{name}.{field}': value
+                          for group in ('load', 'aggregate', 'map') for name, result in results[group].items()
+                          for field, value in result.items() if isinstance(value, (int, float))}
+    return results
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', True
+
+
+# print each timing's ratio to the same scale's timing in previous results
+def compare(results, baseline):
+    baseline = {scale['points']: scale['metrics'] for scale in baseline['scales']}
+    for scale in results['scales']:
+        previous = baseline.get(scale['points'], {})
+        for name, value in scale['metrics'].items():
+            if name.endswith('seconds') and previous.get(name):
+                print(f"{scale['points']:>10,} {name:<40} {previous[name]:10.4f} s -> {value:10.4f} s  {value / previous[name]:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark data loading, aggregation and the map callback on synthetic data.')
+    parser.add_argument('--points', type=int, nargs='+', default=[100000, 1000000], help='soil points of each scale')
+    parser.add_argument('--trade-rows', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each timing (best time is kept)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file (default bench_output/benchmarks-<commit>.json)')
+    parser.add_argument('--baseline', help='previous results file to compare timings with')
+    parser.add_argument('--measure', nargs='+', help=argparse.SUPPRESS)  # a measurement in a child process
+    args = parser.parse_args()
+
+    if args.measure:
+        name, repeat, *arguments = args.measure
+        print(json.dumps(MEASURES[name](*arguments, repeat=int(repeat))))
+        return
+
+    # read before this run's results are written, which may replace the same file
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    commit, dirty = git_commit()
+    results = {'commit': commit, 'dirty': dirty, 'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+               'python': platform.python_version(), 'platform': platform.platform(), 'repeat': args.repeat,
+               'scales': [benchmark(points, args.trade_rows, args.repeat, args.seed) for points in args.points]}
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    output = args.output or os.path.join(OUTPUT_DIR, f'benchmarks-{commit}{"-dirty" if dirty else ""}.json')
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    for scale in results['scales']:
+        for name, value in scale['metrics'].items():
+            print(f"{scale['points']:>10,} {name:<40} {value:14,.4f}")
+    print(f"results -> {output}")
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# ----------------------------------------------------------------------------------------
+# synthetic soil and food trade datasets at a chosen scale, in the CSV format exported from the analysis notebooks
+#
+# soil points lie on the SOCD data's 5 arc-minute grid, each country's points filling a box of grid cells about twice
+# as wide as it is tall; country sizes are skewed like real countries' land areas (a few huge countries, many small
+# ones), so a benchmark can pick huge, medium and small countries; the trade rows' exporters are the same countries,
+# matched by ISO3 code, exporting food items to importing countries in proportion to their size
+# writes data/dfsoil_subUSCN_prod.csv and data/dffood.csv below a directory, e.g. from the project's root directory:
+#   python -m benchmarks.syntheticData bench_output/synthetic --points 1000000 --trade-rows 500000
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import soilIndex
+
+GRID_DEGREES = 1 / 12
+CONTINENTS = ['Africa', 'Asia', 'Europe', 'North America', 'Oceania', 'South America']
+
+
+# names, ISO3 codes, continents and populations of synthetic countries, with each one's soil point count, largest first;
+# counts fall off with rank as 1 / rank ** skew, and every country has at least one point
+def countries(count, points, skew=1.2, seed=0):
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, count + 1) ** skew
+    sizes = np.maximum(np.floor(weights / weights.sum() * points).astype('int64'), 1)
+    sizes[0] += points - sizes.sum()
+    return pd.DataFrame({
+        'Reporter_Country_name': [f'Country {i:03d}' for i in range(count)],
+        # three letter codes AAA, AAB, ... like ISO3 codes
+        'Reporter_Country_ISO3': [''.join(chr(65 + i // 26 ** place % 26) for place in (2, 1, 0)) for i in range(count)],
+        'Reporter_Country_continent': rng.choice(CONTINENTS, count),
+        'Reporter_Country_pop_est': np.round(sizes * rng.uniform(5, 500, count)),
+        'points': sizes,
+    })
+
+
+# the soil points of the countries, each country's points the first of its box's grid cells row by row, the box
+# placed at random on the globe (boxes of different countries may overlap, as a benchmark does not mind)
+def soil_points(dfcountries, depths=(soilIndex.DEPTH,), seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for country in dfcountries.itertuples(index=False):
+        n = int(country.points)
+        columns = int(np.ceil(np.sqrt(2 * n)))
+        rows = -(-n // columns)
+        west = rng.integers(0, 360 * 12) * GRID_DEGREES - 180
+        south = rng.integers(0, max(180 * 12 - rows, 1)) * GRID_DEGREES - 90
+        cell = np.arange(n)
+        lon = (west + (cell % columns + 0.5) * GRID_DEGREES + 180) % 360 - 180
+        lat = np.minimum(south + (cell // columns + 0.5) * GRID_DEGREES, 90 - GRID_DEGREES / 2)
+        frame = pd.DataFrame({'Reporter_Country_lon': lon.astype('float32'), 'Reporter_Country_lat': lat.astype('float32')})
+        # SOCD falls off with depth, as it does in the source data
+        surface = rng.gamma(2, 20, n)
+        for depth in depths:
+            frame[soilIndex.socd_column(depth)] = (surface * np.exp(-depth / 100)).astype('float32')
+        frame['Reporter_Country_name'] = country.Reporter_Country_name
+        frame['Reporter_Country_continent'] = country.Reporter_Country_continent
+        frame['Reporter_Country_ISO3'] = country.Reporter_Country_ISO3
+        frame['Reporter_Country_pop_est'] = country.Reporter_Country_pop_est
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+# trade rows of the countries' food exports to importing countries, exporters drawn in proportion to their size
+def food_trade(dfcountries, rows, partners=200, items=400, seed=0):
+    rng = np.random.default_rng(seed)
+    exporter = rng.choice(len(dfcountries), rows, p=dfcountries['points'] / dfcountries['points'].sum())
+    exporters = dfcountries.iloc[exporter].reset_index(drop=True)
+    return pd.DataFrame({
+        'Reporter_Country_name_x': exporters['Reporter_Country_name'],
+        'Partner_Country_name': pd.Series([f'Importer {i:03d}' for i in range(partners)]).iloc[rng.zipf(1.5, rows) % partners].to_numpy(),
+        'Item': pd.Series([f'Food {i:03d}' for i in range(items)]).iloc[rng.integers(0, items, rows)].to_numpy(),
+        'Export_Quantity_2019_Value_tonnes': np.round(rng.lognormal(6, 3, rows)),
+        'Reporter_Country_ISO3': exporters['Reporter_Country_ISO3'],
+        'Reporter_Country_continent': exporters['Reporter_Country_continent'],
+        'Reporter_Country_name_y': exporters['Reporter_Country_name'],
+        'Reporter_Country_pop_est': exporters['Reporter_Country_pop_est'],
+    })
+
+
+# write both datasets' CSV files below a directory, where the app's data directory would be
+def generate(directory, points, trade_rows, countries_count=150, depths=(soilIndex.DEPTH,), seed=0):
+    os.makedirs(os.path.join(directory, 'data'), exist_ok=True)
+    dfcountries = countries(countries_count, points, seed=seed)
+    soil_points(dfcountries, depths, seed).to_csv(os.path.join(directory, 'data', 'dfsoil_subUSCN_prod.csv'))
+    food_trade(dfcountries, trade_rows, seed=seed).to_csv(os.path.join(directory, 'data', 'dffood.csv'))
+    return dfcountries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic soil and food trade CSV files at a chosen scale.')
+    parser.add_argument('directory', help='directory to write data/ below')
+    parser.add_argument('--points', type=int, default=1000000, help='soil points in all (e.g. 100000 to 10000000)')
+    parser.add_argument('--trade-rows', type=int, default=500000)
+    parser.add_argument('--countries', type=int, default=150)
+    parser.add_argument('--all-depths', action='store_true', help='write SOCD at every depth, not only the surface')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.directory, args.points, args.trade_rows, args.countries,
+             soilIndex.DEPTHS if args.all_depths else (soilIndex.DEPTH,), args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# ----------------------------------------------------------------------------------------
+# time of the map's viewport queries through the spatial bucket index, against the country's whole slice
+#
+# for the largest countries, queries a window of the size the map shows at a high zoom, centered on random points
+# of the country, and times finding its points through the buckets and filtering the whole country's points to it;
+# the bucket query's time follows the points in view, not the country's size
+# run from the project's root directory with:
+#   python -m benchmarks.viewportQuery [--countries 3] [--zoom 8] [--queries 200] [--seed 0]
+
+import argparse
+import json
+import time
+import numpy as np
+import dataStore
+import soilIndex
+
+
+def timed(query, windows):
+    start = time.perf_counter()
+    points = sum(len(query(window)['lon']) for window in windows)
+    return (time.perf_counter() - start) / len(windows) * 1000, points
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time viewport queries of the soil point index.')
+    parser.add_argument('--countries', type=int, default=3, help='largest countries by points to query')
+    parser.add_argument('--zoom', type=float, default=8, help='map zoom of the window queried')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    pyramid = soilIndex.load(dataStore.load_soil())
+    index = pyramid.levels[0]
+    # a window about 900 x 450 pixels wide at the zoom, 512 pixels spanning 360 degrees at zoom 0
+    width = 900 * 360 / (512 * 2 ** args.zoom)
+    for country in sorted(index.countries, key=lambda country: -pyramid.count(country, 0))[:args.countries]:
+        points = index.slice(country)
+        centers = rng.integers(0, len(points['lon']), args.queries)
+        windows = [(float(lon) - width / 2, float(lat) - width / 4, float(lon) + width / 2, float(lat) + width / 4)
+                   for lon, lat in zip(points['lon'][centers], points['lat'][centers])]
+
+        def filtered(window):
+            west, south, east, north = window
+            inside = (points['lon'] >= west) & (points['lon'] <= east) & (points['lat'] >= south) & (points['lat'] <= north)
+            return {key: array[inside] for key, array in points.items()}
+
+        bucket_ms, bucket_points = timed(lambda window: index.window(country, window), windows)
+        scan_ms, scan_points = timed(filtered, windows)
+        print(json.dumps({'country': country, 'country_points': len(points['lon']), 'zoom': args.zoom,
+                          'points_in_view': round(bucket_points / len(windows)), 'same_points': bucket_points == scan_points,
+                          'bucket_ms': round(bucket_ms, 3), 'scan_ms': round(scan_ms, 3)}))
+
+
+if __name__ == '__main__':
+    main()
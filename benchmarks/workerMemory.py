@@ -0,0 +1,52 @@
+# ----------------------------------------------------------------------------------------
+# memory of the app's gunicorn workers as their number grows, under the same load (see benchmarks/loadTest.py)
+#
+# a load test is run for each number of workers, and the workers' resident memory (RSS) and proportional set size
+# (PSS) are read at its end: RSS counts every page a worker maps, including those it shares with the parent and the
+# other workers, so it is about the same per worker however the memory is shared; PSS divides each shared page among
+# the processes sharing it, so the workers' total PSS is the memory they really take, and grows by only what each
+# worker holds on its own (e.g. its figure cache) when the data is shared
+# run from the project's root directory with, e.g.:
+#   python -m benchmarks.workerMemory [--workers 1 2 4 8] [--points 1000000] [--duration 30]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def load_test(workers, args):
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'loadtest.json')
+        command = [sys.executable, '-m', 'benchmarks.loadTest', '--workers', str(workers), '--users', str(args.users),
+                   '--duration', str(args.duration), '--interval', str(args.interval), '--output', output]
+        if args.points:
+            command += ['--points', str(args.points), '--trade-rows', str(args.trade_rows)]
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the gunicorn workers' memory as their number grows.")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--interval', type=float, default=10)
+    parser.add_argument('--points', type=int, help="serve a scale of the benchmark suite's synthetic data")
+    parser.add_argument('--trade-rows', type=int, default=500000)
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'req/s':>7} {'RSS MB':>8} {'PSS MB':>8} {'PSS/worker':>10}  each worker's RSS / PSS MB")
+    for workers in args.workers:
+        results = load_test(workers, args)
+        last = results['timeline'][-1]
+        print(f"{workers:>7} {results['total']['requests_per_second']:>7.1f} {last['rss_mb']:>8.0f} {last['pss_mb']:>8.0f} "
+              f"{last['pss_mb'] / workers:>10.0f}  "
+              + ' '.join(f"{worker['rss_mb']:.0f}/{worker['pss_mb']:.0f}" for worker in last['workers']))
+
+
+if __name__ == '__main__':
+    main()
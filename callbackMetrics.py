@@ -0,0 +1,163 @@
+# ----------------------------------------------------------------------------------------
+# Prometheus-style metrics of the app's Dash callbacks, served as text by the app's own Flask server at /metrics
+#
+# each request to Dash's callback endpoint (/_dash-update-component) is timed from Flask's before_request to its
+# after_request hook and counted into per-callback histograms of latency and of response size (the JSON Dash
+# serialized, before any compression); a callback can also time named phases of its own work (e.g. the map's
+# slicing, figure building and serialization) and label its request with the countries selected, so the countries
+# that are expensive to serve stand out (any country the app does not have is labelled 'other', so clients cannot
+# add series without bound)
+# counters are kept in each process, so each gunicorn worker serves its own, with its pid in dash_worker_info
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+import flask
+
+CALLBACK_PATH = '/_dash-update-component'
+# upper bounds of the histograms' buckets, in seconds and bytes
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1000, 10000, 100000, 250000, 500000, 1000000, 2500000, 5000000, 10000000)
+# the country label of requests selecting a country the app does not have
+OTHER_COUNTRY = 'other'
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name, self.help, self.buckets = name, help, buckets
+        self.series = {}  # label pairs -> [count in each bucket and +Inf, sum]
+
+    def observe(self, labels, value):
+        series = self.series.setdefault(labels, [0] * (len(self.buckets) + 2))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[len(self.buckets)] += 1
+        series[-1] += value
+
+    def lines(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, series in sorted(self.series.items()):
+            for bound, count in zip([*map(str, self.buckets), '+Inf'], series):
+                yield f'{self.name}_bucket{format_labels(labels + (("le", bound),))} {count}'
+            yield f'{self.name}_sum{format_labels(labels)} {format_value(series[-1])}'
+            yield f'{self.name}_count{format_labels(labels)} {series[len(self.buckets)]}'
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name, self.help = name, help
+        self.series = {}  # label pairs -> value
+
+    def add(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def lines(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self.series.items()):
+            yield f'{self.name}{format_labels(labels)} {format_value(value)}'
+
+
+class CallbackMetrics:
+    def __init__(self, app, path='/metrics'):
+        self.app = app
+        self.metrics = [
+            Counter('dash_callback_requests_total', 'Dash callback requests, by callback and HTTP status.'),
+            Histogram('dash_callback_duration_seconds', 'Dash callback request latency, from request to response.', SECONDS_BUCKETS),
+            Histogram('dash_callback_response_bytes', 'Serialized size of Dash callback responses.', BYTES_BUCKETS),
+            Histogram('dash_callback_phase_seconds', 'Time in named phases of a callback, e.g. filter, figure and serialize.', SECONDS_BUCKETS),
+            Counter('dash_callback_country_requests_total', 'Callback requests with a country selected, by callback and country.'),
+            Counter('dash_callback_country_seconds_total', 'Callback latency of requests with a country selected, by callback and country.'),
+            Counter('dash_callback_country_response_bytes_total', 'Response bytes of requests with a country selected, by callback and country.'),
+        ]
+        self.requests, self.duration, self.size, self.phases, self.country_requests, self.country_seconds, self.country_bytes = self.metrics
+        self.gauges = []  # (name, help, function returning its value)
+        # Flask's development server handles requests in threads
+        self.lock = threading.Lock()
+        server = app.server
+        server.before_request(self.start)
+        server.after_request(self.finish)
+        server.add_url_rule(path, 'metrics', self.serve)
+
+    # a value read when the metrics are served, e.g. the size of a cache
+    def gauge(self, name, help, value):
+        self.gauges.append((name, help, value))
+
+    # the name of the callback function a callback request is for, or its outputs when it has none
+    def callback_name(self):
+        body = flask.request.get_json(silent=True) or {}
+        output = body.get('output', '')
+        callback = self.app.callback_map.get(output, {}).get('callback')
+        return getattr(callback, '__name__', output)
+
+    def start(self):
+        if flask.request.path == CALLBACK_PATH:
+            flask.g.callback_started = time.perf_counter()
+            flask.g.callback_name = self.callback_name()
+
+    def finish(self, response):
+        started = flask.g.get('callback_started')
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        size = response.calculate_content_length() or 0
+        callback = (('callback', flask.g.callback_name),)
+        with self.lock:
+            self.requests.add(callback + (('status', str(response.status_code)),))
+            self.duration.observe(callback, seconds)
+            self.size.observe(callback, size)
+            for country in flask.g.get('callback_countries', ()):
+                labels = callback + (('country', country),)
+                self.country_requests.add(labels)
+                self.country_seconds.add(labels, seconds)
+                self.country_bytes.add(labels, size)
+        return response
+
+    # time a named phase of the callback being served, e.g. with metrics.phase('filter'): ...;
+    # outside a callback request (e.g. pre-warming a cache at startup) nothing is recorded
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if flask.has_request_context() and 'callback_name' in flask.g:
+                with self.lock:
+                    self.phases.observe((('callback', flask.g.callback_name), ('phase', name)), time.perf_counter() - started)
+
+    # label the callback request being served with the countries selected; any not among the known countries (e.g.
+    # the app's country names) are labelled OTHER_COUNTRY together, as a client can post any value, and each label
+    # value is a series held until the process exits
+    def countries(self, countries, known=()):
+        if flask.has_request_context():
+            flask.g.callback_countries = list(dict.fromkeys(str(country) if country in known else OTHER_COUNTRY
+                                                            for country in countries))
+
+    def text(self):
+        lines = ['# HELP dash_worker_info The process serving these metrics.', '# TYPE dash_worker_info gauge',
+                 f'dash_worker_info{format_labels((("pid", str(os.getpid())),))} 1']
+        with self.lock:
+            for metric in self.metrics:
+                lines.extend(metric.lines())
+        for name, help, value in self.gauges:
+            lines.extend([f'# HELP {name} {help}', f'# TYPE {name} gauge', f'{name} {format_value(value())}'])
+        return '\n'.join(lines) + '\n'
+
+    def serve(self):
+        return flask.Response(self.text(), mimetype='text/plain; version=0.0.4')
+
+
+# label pairs in the exposition format, e.g. {callback="toggle_modal",le="0.05"}, with values escaped
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+# a sample value in full, e.g. 1423190 rather than 1.42319e+06
+def format_value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
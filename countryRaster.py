@@ -0,0 +1,78 @@
+# ----------------------------------------------------------------------------------------
+# country of each cell of the SOCD data's 5 arc-minute grid, by rasterizing the naturalearth country polygons
+#
+# the soil points are the centers of a regular grid, so instead of a spatial join of every point against the
+# polygons, each country's polygons are filled once onto the same grid by scanline: a cell is in a country when
+# its center is inside the country's rings by the even-odd rule, which also leaves out the polygons' holes;
+# a point's country is then an array lookup of its grid row and column, with no geometry operation per point
+# built by the rasterized country stage of `python dataPipeline.py`
+
+import numpy as np
+
+GRID_DEGREES = 1 / 12
+GRID_ROWS, GRID_COLUMNS = 180 * 12, 360 * 12
+# raster value of the cells outside every country, e.g. in the oceans
+NO_COUNTRY = -1
+
+
+def row_of(lat):
+    return np.clip(np.floor((np.asarray(lat, dtype='float64') + 90) / GRID_DEGREES), 0, GRID_ROWS - 1).astype('int64')
+
+
+def column_of(lon):
+    return np.clip(np.floor((np.asarray(lon, dtype='float64') + 180) / GRID_DEGREES), 0, GRID_COLUMNS - 1).astype('int64')
+
+
+# the rings of a polygon or multipolygon geometry, each an array of its lon, lat vertices
+def rings(geometry):
+    polygons = getattr(geometry, 'geoms', [geometry])
+    return [np.asarray(ring.coords)[:, :2] for polygon in polygons for ring in [polygon.exterior, *polygon.interiors]]
+
+
+# the grid cells with centers inside a country's rings, as the top row and left column of the rings' bounding box
+# and a boolean mask of the cells in it; None when the rings cover no cell center
+def fill(country_rings):
+    start = np.concatenate(country_rings)
+    end = np.concatenate([np.roll(ring, -1, axis=0) for ring in country_rings])
+    crossing = start[:, 1] != end[:, 1]
+    (x0, y0), (x1, y1) = start[crossing].T, end[crossing].T
+    # every row whose center latitude an edge crosses, counting an edge's lower end but not its upper end,
+    # so each ring crosses each row an even number of times
+    first = np.ceil((np.minimum(y0, y1) + 90) / GRID_DEGREES - 0.5).astype('int64')
+    counts = np.ceil((np.maximum(y0, y1) + 90) / GRID_DEGREES - 0.5).astype('int64') - first
+    edge = np.repeat(np.arange(len(first)), counts)
+    row = first[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(counts) - counts, counts)
+    center = -90 + (row + 0.5) * GRID_DEGREES
+    x = x0[edge] + (center - y0[edge]) * (x1 - x0)[edge] / (y1 - y0)[edge]
+    if not len(x):
+        return None
+
+    # a row's crossings from west to east pair up into the spans inside the rings
+    order = np.lexsort((x, row))
+    row, x = row[order], x[order]
+    spans = row[0::2]
+    west = np.clip(np.ceil((x[0::2] + 180) / GRID_DEGREES - 0.5), 0, GRID_COLUMNS).astype('int64')
+    east = np.clip(np.ceil((x[1::2] + 180) / GRID_DEGREES - 0.5), 0, GRID_COLUMNS).astype('int64')
+    top, left = int(spans.min()), int(west.min())
+    # +1 where each span starts and -1 where it stops, summed along each row
+    edges = np.zeros((int(spans.max()) - top + 1, int(east.max()) - left + 1), dtype='int16')
+    np.add.at(edges, (spans - top, west - left), 1)
+    np.add.at(edges, (spans - top, east - left), -1)
+    return top, left, np.cumsum(edges, axis=1)[:, :-1] > 0
+
+
+# the country raster of the grid, each cell holding its country's position in geometries, or NO_COUNTRY
+def rasterize(geometries):
+    grid = np.full((GRID_ROWS, GRID_COLUMNS), NO_COUNTRY, dtype='int16')
+    for code, geometry in enumerate(geometries):
+        filled = fill(rings(geometry)) if geometry is not None else None
+        if filled is None:
+            continue
+        top, left, mask = filled
+        grid[top:top + mask.shape[0], left:left + mask.shape[1]][mask] = code
+    return grid
+
+
+# the country code of each point of the grid
+def lookup(grid, lon, lat):
+    return grid[row_of(lat), column_of(lon)]
@@ -0,0 +1,61 @@
+# ----------------------------------------------------------------------------------------
+# country-level soil statistics: one row per country summarizing its SOCD measurements
+#
+# computed in one groupby aggregate over the soil points, instead of broadcasting each country's mean back onto
+# all of its rows and dropping duplicates; the resulting table of about 150 rows is what the Density Ranges bar
+# chart and the trade partner dropdown are both made from
+# saved for every SOCD depth alongside the columnar data store by `python dataStore.py`, and otherwise computed at startup
+
+import os
+import pandas as pd
+import soilIndex
+
+STATS_STORE = os.path.join('.', 'data', 'dfsoilStats.parquet')
+
+# country attributes repeated on every soil point, kept once per country
+ATTRIBUTES = ['Reporter_Country_continent', 'Reporter_Country_ISO3', 'Reporter_Country_pop_est']
+
+
+# a quantile of each group's values, as an aggregation function
+def quantile(q):
+    return lambda values: values.quantile(q)
+
+
+def country_stats(dfsoil, socd=soilIndex.socd_column(soilIndex.DEPTH)):
+    dfsoilStats = dfsoil.groupby('Reporter_Country_name', observed=True).agg(
+        **{attribute: (attribute, 'first') for attribute in ATTRIBUTES},
+        SOCDcountryMean=(socd, 'mean'),
+        SOCDcountryCount=(socd, 'count'),
+        SOCDcountryMin=(socd, 'min'),
+        SOCDcountryMax=(socd, 'max'),
+        SOCDcountryQ1=(socd, quantile(0.25)),
+        SOCDcountryMedian=(socd, quantile(0.5)),
+        SOCDcountryQ3=(socd, quantile(0.75)),
+    )
+    # highest mean first, then by continent and name, the order of the bars in the Density Ranges chart
+    return dfsoilStats.reset_index().sort_values(by=['SOCDcountryMean', 'Reporter_Country_continent', 'Reporter_Country_name'],
+                                                 ascending=(False, True, True)).reset_index(drop=True)
+
+
+# the statistics at every SOCD depth of the soil data, in one table with the depth in column SOCDdepth
+def depth_stats(dfsoil):
+    return pd.concat([country_stats(dfsoil, soilIndex.socd_column(depth)).assign(SOCDdepth=depth)
+                      for depth in soilIndex.DEPTHS if soilIndex.socd_column(depth) in dfsoil], ignore_index=True)
+
+
+def save(dfsoilStats, path=STATS_STORE):
+    dfsoilStats.to_parquet(path, engine='pyarrow', index=False)
+
+
+# one depth's statistics from the saved table when it is current (see dataStore.built_version), otherwise aggregated
+# from the soil dataframe given, or from only that depth's column of the soil data, loaded when there is no table
+def load(dfsoil=None, path=STATS_STORE, depth=soilIndex.DEPTH):
+    import dataStore  # imported here, since it imports this module
+    if dataStore.built_version() and os.path.exists(path):
+        try:
+            return pd.read_parquet(path, filters=[('SOCDdepth', '==', depth)]).drop(columns='SOCDdepth')
+        except ImportError:
+            pass
+    if dfsoil is None:
+        dfsoil = dataStore.load_soil([depth])
+    return country_stats(dfsoil, soilIndex.socd_column(depth))
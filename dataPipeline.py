@@ -0,0 +1,274 @@
+# ----------------------------------------------------------------------------------------
+# offline data preparation pipeline: from the raw source files to the soil and food trade CSVs the app is built from
+#
+# the scripted stages of analysis/food_soil_data_analysis_merge.ipynb, each cached as a Parquet file under
+# data/pipeline named by a version of the stage's code, its parameters and its inputs (a raw file's size and
+# modification time, or an earlier stage's version), so a rerun skips every stage whose inputs are unchanged;
+# the SOCD grid is converted to points a band of latitudes at a time, each band's depths selected in xarray before
+# it is flattened, so the full 8-depth cube never materializes in pandas, and every depth is a column of the
+# points, the app's surface depth (4.5 cm) deciding which cells are land; soil points
+# are assigned their country by a raster of the country polygons on the same grid (see countryRaster.py)
+# raw source files are not saved in the repo (see the notebook and README for where to download them);
+# run from the project's root directory with:
+#   python dataPipeline.py [--socd ./data/SOCD5min.nc] [--trade ...] [--country-codes ...]
+# which writes dataStore.SOIL_CSV and dataStore.FOOD_CSV and then builds the app's data store from them
+
+import argparse
+import collections
+import glob
+import hashlib
+import inspect
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import countryRaster
+import dataStore
+import soilIndex
+
+PIPELINE_DIR = os.path.join('.', 'data', 'pipeline')
+
+# raw source files, downloaded from
+# http://globalchange.bnu.edu.cn/research/soilwd.jsp "Soil organic carbon density: SOCD5min.zip",
+# https://www.fao.org/faostat/en/#data/TM "All Data Normalized", and FAOSTAT's country codes definitions
+SOCD_NC = os.path.join('.', 'data', 'SOCD5min.nc')
+TRADE_CSV = os.path.join('.', 'data', 'Trade_DetailedTradeMatrix_E_All_Data_(Normalized).csv')
+COUNTRY_CODES_CSV = os.path.join('.', 'data', 'FAOSTAT_data_11-26-2021.csv')
+
+# depths of the SOCD measurements in cm, the first (the surface depth the app starts with) deciding which cells are land
+DEPTHS = soilIndex.DEPTHS
+# latitude rows of the SOCD grid read at a time: 120 rows of 5 arc-minutes are a 10 degree band of 4,320 cells a row
+BAND_ROWS = 120
+# SOCD points sampled to verify the rasterized countries against a spatial join
+VERIFY_SAMPLE = 20000
+# FAOSTAT element code of the 'Export Quantity' rows of the trade matrix, and the year the app shows
+EXPORT_QUANTITY = 5910
+YEAR = 2019
+# FAOSTAT partner country codes the soil data is limited to, for scale, as selected for dfsoil_subUSCN in the notebook:
+# China, mainland (41), China, Hong Kong SAR (96), China, Macao SAR (128), China, Taiwan Province of (214) and China (351)
+PARTNERS = [41, 96, 128, 214, 351]
+
+# column names of the naturalearth countries joined to the soil points, as named in the app's data
+SOIL_COLUMNS = {
+    'lon': 'Reporter_Country_lon',
+    'lat': 'Reporter_Country_lat',
+    **{f'SOCD{soilIndex.depth_suffix(depth)}': soilIndex.socd_column(depth) for depth in DEPTHS},
+    'pop_est': 'Reporter_Country_pop_est',
+    'continent': 'Reporter_Country_continent',
+    'name': 'Reporter_Country_name',
+    'iso_a3': 'Reporter_Country_ISO3',
+    'gdp_md_est': 'Reporter_Country_gdp_md_est',
+}
+# naturalearth country attributes, by their own names
+WORLD_COLUMNS = ['pop_est', 'continent', 'name', 'iso_a3', 'gdp_md_est']
+# country attributes of the soil data added to every trade row, e.g. for the At Risk Foods chart
+COUNTRY_COLUMNS = ['Reporter_Country_continent', 'Reporter_Country_name', 'Reporter_Country_ISO3',
+                   'Reporter_Country_gdp_md_est', 'Reporter_Country_pop_est']
+
+# a stage's cached output and the version it was made from
+Result = collections.namedtuple('Result', ['path', 'version'])
+
+
+# ----------------------------------------------------------------------------------------
+# stages: each a function of raw file paths and earlier stages' dataframes, returning a dataframe (or writing its output file)
+
+# the SOCD grid's land cells, as points with lon, lat and an SOCD column for each depth (e.g. SOCD4_5), written to a
+# Parquet file a band of latitude rows at a time: each band is read from the NetCDF file alone, its NaN (masked ocean)
+# cells at the first depth dropped and its land points appended as a row group, so memory is bounded by the band
+def socd_points(socd_path, path, depths=DEPTHS, band_rows=BAND_ROWS):
+    import xarray as xr
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    names = [f'SOCD{soilIndex.depth_suffix(depth)}' for depth in depths]
+    with xr.open_dataset(socd_path) as ds:
+        # select the depths lazily, so only their slices of the grid are read
+        socd = ds['SOCD'].sel(depth=depths).transpose('depth', 'lat', 'lon')
+        lon, lat = socd['lon'].values, socd['lat'].values
+        schema = pa.schema([('lon', pa.from_numpy_dtype(lon.dtype)), ('lat', pa.from_numpy_dtype(lat.dtype))]
+                           + [(name, pa.from_numpy_dtype(socd.dtype)) for name in names])
+        with pq.ParquetWriter(path, schema) as writer:
+            for start in range(0, len(lat), band_rows):
+                band = socd.isel(lat=slice(start, start + band_rows)).values
+                rows, columns = np.nonzero(~np.isnan(band[0]))
+                writer.write_table(pa.table({'lon': lon[columns], 'lat': lat[start + rows],
+                                             **{name: values[rows, columns] for name, values in zip(names, band)}},
+                                            schema=schema))
+
+
+# the naturalearth countries' attributes, in the order of their polygons
+def world_countries(world_path):
+    import geopandas as gpd
+    world = gpd.read_file(world_path, ignore_geometry=True)
+    return pd.DataFrame(world)[WORLD_COLUMNS].reset_index(drop=True)
+
+
+# the naturalearth country polygons rasterized onto the SOCD grid, one row per grid cell (row-major from the south-west)
+# holding its country's position in world_countries
+def country_grid(world_path):
+    import geopandas as gpd
+    world = gpd.read_file(world_path)
+    return pd.DataFrame({'country': countryRaster.rasterize(world.geometry).ravel()})
+
+
+# the country each soil point is in, looked up in the country raster by the point's grid cell;
+# points outside every country (e.g. on small islands the polygons leave out) are dropped
+def soil_countries(points, grid, countries):
+    codes = countryRaster.lookup(grid['country'].to_numpy().reshape(countryRaster.GRID_ROWS, countryRaster.GRID_COLUMNS),
+                                 points['lon'], points['lat'])
+    inside = codes != countryRaster.NO_COUNTRY
+    df = pd.concat([points[inside].reset_index(drop=True), countries.iloc[codes[inside]].reset_index(drop=True)], axis=1)
+    # deeper depths may be missing where the surface has a value, so only missing country attributes drop a point
+    return df[list(SOIL_COLUMNS)].rename(columns=SOIL_COLUMNS).dropna(subset=COUNTRY_COLUMNS).reset_index(drop=True)
+
+
+# the country names of points by a spatial join with the country polygons, the notebook's way, to verify the raster by
+def sjoin_names(points, world_path):
+    import geopandas as gpd
+    # CRS according to the SOCD data source documentation, readme available at http://globalchange.bnu.edu.cn/download/doc/worldsoil/readme.zip
+    gdf = gpd.GeoDataFrame(points, geometry=gpd.points_from_xy(points['lon'], points['lat']), crs="EPSG:4326")
+    joined = gpd.sjoin(gdf, gpd.read_file(world_path)[['name', 'geometry']], how='left')
+    # a point on the border of two polygons takes the first
+    return joined[~joined.index.duplicated()]['name']
+
+
+# compare the raster's countries of a random sample of the SOCD points with a spatial join's, which differ only for
+# cells whose center is within rounding of a border
+def verify_countries(points, soil, world_path, sample, seed=0):
+    points = pd.read_parquet(points.path)
+    points = points.sample(min(sample, len(points)), random_state=seed).reset_index(drop=True)
+    expected = sjoin_names(points, world_path)
+    labelled = points.merge(pd.read_parquet(soil.path, columns=['Reporter_Country_lon', 'Reporter_Country_lat', 'Reporter_Country_name']),
+                            how='left', left_on=['lon', 'lat'], right_on=['Reporter_Country_lon', 'Reporter_Country_lat'])
+    got = labelled['Reporter_Country_name']
+    same = (got == expected) | (got.isna() & expected.isna())
+    print(f"country raster vs spatial join: {same.mean():.4%} of {len(points):,} sampled points agree")
+    if not same.all():
+        print(pd.DataFrame({'lon': points['lon'], 'lat': points['lat'], 'raster': got, 'sjoin': expected})[~same].head(10).to_string())
+    return same.mean()
+
+
+# the year's export quantities of the trade matrix, with each reporter country's ISO3 code
+def trade_exports(trade_path, codes_path, year=YEAR):
+    # the trade matrix is not UTF-8 encoded
+    dffood = pd.read_csv(trade_path, encoding="ISO-8859-1")
+    dffood = dffood[(dffood['Element Code'] == EXPORT_QUANTITY) & (dffood['Year'] == year)]
+    dffood = dffood.drop(['Element Code', 'Element', 'Year Code', 'Year', 'Unit', 'Item Code'], axis=1).rename(columns={
+        "Value": "Export_Quantity_2019_Value_tonnes",
+        "Reporter Country Code": "Reporter_Country_Code",
+        "Reporter Countries": "Reporter_Country_name",
+        "Partner Countries": "Partner_Country_name",
+    })
+    codes = pd.read_csv(codes_path).rename(columns={"Country Code": "Reporter_Country_Code", "ISO3 Code": "Reporter_Country_ISO3"})
+    dffood = dffood.merge(codes[['Reporter_Country_Code', 'Reporter_Country_ISO3']], how='left', on='Reporter_Country_Code')
+    # there is no "China" reporter in the trade matrix; China, mainland (41) takes China's ISO3 code
+    dffood.loc[dffood['Reporter_Country_Code'] == 41, 'Reporter_Country_ISO3'] = 'CHN'
+    return dffood.reset_index(drop=True)
+
+
+# the soil points of only the countries exporting food to the given trade partners
+def partner_soil(dfsoil, trade, partners=PARTNERS):
+    exporters = trade.loc[trade['Partner Country Code'].isin(partners), 'Reporter_Country_ISO3'].unique()
+    return dfsoil[dfsoil['Reporter_Country_ISO3'].isin(exporters)].reset_index(drop=True)
+
+
+# the trade rows with the soil data's country attributes of their reporter country, linked by ISO3 code;
+# the trade matrix's own country name becomes Reporter_Country_name_x and naturalearth's Reporter_Country_name_y
+def food_trade(trade, dfsoil):
+    countries = dfsoil[COUNTRY_COLUMNS].drop_duplicates()
+    return trade.drop(['Reporter_Country_Code', 'Partner Country Code'], axis=1).merge(countries, how='left', on='Reporter_Country_ISO3')
+
+
+# ----------------------------------------------------------------------------------------
+# running stages with their cached outputs
+
+# a raw file's version, by its size and modification time rather than hashing gigabytes of NetCDF
+def file_version(path):
+    stat = os.stat(path)
+    return f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+# the names a function's code uses, including those of the functions and lambdas defined in it
+def code_names(code):
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if inspect.iscode(constant):
+            names |= code_names(constant)
+    return names
+
+
+# a stage's source and that of the project's modules it calls (e.g. countryRaster for country_grid), so a change to
+# a helper module reruns the stages using it as a change to the stage itself does
+def stage_source(stage):
+    project = os.path.dirname(os.path.abspath(__file__))
+    modules = sorted((name for name in code_names(stage.__code__)
+                      if inspect.ismodule(stage.__globals__.get(name))
+                      and os.path.dirname(os.path.abspath(getattr(stage.__globals__[name], '__file__', None) or '/')) == project),
+                     key=str)
+    return '\n'.join([inspect.getsource(stage)] + [inspect.getsource(stage.__globals__[name]) for name in modules])
+
+
+# run a stage, or reuse its output from an earlier run when the stage's code (see stage_source), parameters and inputs
+# are unchanged; inputs are raw file paths or the Results of earlier stages, and parameters are passed on as keywords;
+# a streamed stage writes its output file itself, given its path, instead of returning a dataframe
+def run(name, stage, *inputs, streamed=False, **parameters):
+    versions = [source.version if isinstance(source, Result) else file_version(source) for source in inputs]
+    text = '\n'.join([stage_source(stage), repr(sorted(parameters.items()))] + versions)
+    version = hashlib.sha256(text.encode()).hexdigest()[:16]
+    path = os.path.join(PIPELINE_DIR, f'{name}-{version}.parquet')
+    if os.path.exists(path):
+        print(f"{name}: unchanged, {path}")
+        return Result(path, version)
+
+    start = time.perf_counter()
+    arguments = [pd.read_parquet(source.path) if isinstance(source, Result) else source for source in inputs]
+    os.makedirs(PIPELINE_DIR, exist_ok=True)
+    # written under a temporary name, so an interrupted stage leaves no output to be reused
+    partial = path + '.partial'
+    if streamed:
+        stage(*arguments, partial, **parameters)
+    else:
+        stage(*arguments, **parameters).to_parquet(partial, engine='pyarrow', index=False)
+    # outputs of the stage's earlier versions are not read again
+    for stale in glob.glob(os.path.join(PIPELINE_DIR, f'{name}-*.parquet')):
+        os.remove(stale)
+    os.replace(partial, path)
+    rows = pq.ParquetFile(path).metadata.num_rows
+    print(f"{name}: {rows:,} rows -> {path} in {time.perf_counter() - start:.1f} s")
+    return Result(path, version)
+
+
+# write a stage's output as one of the CSVs the app's data store is built from, with the index column it is read with
+def export(result, csv_path):
+    pd.read_parquet(result.path).to_csv(csv_path)
+    print(f"{result.path} -> {csv_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare the app's soil and food trade data from the raw source files.")
+    parser.add_argument('--socd', default=SOCD_NC, help='SOCD5min.nc soil organic carbon density grid')
+    parser.add_argument('--trade', default=TRADE_CSV, help='FAOSTAT detailed trade matrix, all data normalized')
+    parser.add_argument('--country-codes', default=COUNTRY_CODES_CSV, help='FAOSTAT country codes with ISO3 codes')
+    parser.add_argument('--world', help='country polygons (default: geopandas naturalearth_lowres)')
+    parser.add_argument('--verify', type=int, default=VERIFY_SAMPLE,
+                        help='SOCD points whose raster country is checked against a spatial join (0 to skip)')
+    parser.add_argument('--band-rows', type=int, default=BAND_ROWS, help='latitude rows of the SOCD grid read at a time')
+    args = parser.parse_args()
+    if args.world is None:
+        import geopandas as gpd
+        args.world = gpd.datasets.get_path('naturalearth_lowres')
+
+    points = run('socdPoints', socd_points, args.socd, streamed=True, depths=DEPTHS, band_rows=args.band_rows)
+    countries = run('worldCountries', world_countries, args.world)
+    grid = run('countryGrid', country_grid, args.world)
+    soil = run('soilCountries', soil_countries, points, grid, countries)
+    if args.verify:
+        verify_countries(points, soil, args.world, args.verify)
+    trade = run('tradeExports', trade_exports, args.trade, args.country_codes, year=YEAR)
+    export(run('partnerSoil', partner_soil, soil, trade, partners=PARTNERS), dataStore.SOIL_CSV)
+    export(run('foodTrade', food_trade, trade, soil), dataStore.FOOD_CSV)
+    dataStore.build()
+
+
+if __name__ == '__main__':
+    main()
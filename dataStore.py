@@ -0,0 +1,216 @@
+# ----------------------------------------------------------------------------------------
+# columnar data store for the app's soil and food trade datasets
+#
+# the CSV files exported from the analysis notebooks are large text files, and parsing them and inferring their
+# dtypes at every app boot is slow; this module converts them once into Parquet files typed by an explicit schema,
+# with the repeated country, continent and item labels stored as categoricals, and loads whichever is available at app startup
+#
+# build (or rebuild after the CSV files change) from the project's root directory with:
+#   python dataStore.py
+# which also writes the per-country soil point index for the map (see soilIndex.py), the country soil statistics
+# (see countryStats.py), the prebuilt charts (see staticFigures.py) and the trade cube and index (see tradeCube.py
+# and tradeIndex.py), everything the app otherwise computes at startup, and last stamps them with one build version
+# (see built_version), which the app checks before using any of them
+
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+import countryStats
+import soilIndex
+
+# ----------------------------------------------------------------------------------------
+# file locations, relative to the project's root directory same as app.py
+DATA_DIR = './data'
+
+# -- 2019 food trade matrix export quantities (exported from analysis in Jupyter Notebook)
+FOOD_CSV = os.path.join(DATA_DIR, 'dffood.csv')
+FOOD_STORE = os.path.join(DATA_DIR, 'dffood.parquet')
+
+# -- soil organic carbon density measurements (at 4.5 cm depth, and when prepared with dataPipeline.py at each depth) for China's and U.S.'s trade partners (exported from analysis in Jupyter Notebook)
+SOIL_CSV = os.path.join(DATA_DIR, 'dfsoil_subUSCN_prod.csv')
+SOIL_STORE = os.path.join(DATA_DIR, 'dfsoil_subUSCN_prod.parquet')
+
+# -- the version stamp of everything built from the CSV files, written last by build()
+BUILD_STAMP = os.path.join(DATA_DIR, 'build.json')
+# the modules whose code shapes what is built, found beside this one
+BUILD_MODULES = ['dataStore.py', 'soilIndex.py', 'countryStats.py', 'staticFigures.py', 'humanFormat.py',
+                 'tradeCube.py', 'tradeIndex.py', 'sharedArrays.py']
+
+# ----------------------------------------------------------------------------------------
+# schema: the dtype of each column, applied as the CSV is read and kept in the columnar store
+# label columns repeated on many rows are categoricals, so each distinct label is held only once, and the soil
+# point coordinates and SOCD are float32, which holds 5 arc-minute grid coordinates to well under a meter and
+# SOCD to far more digits than it is measured with; populations and trade quantities, which are summed, stay float64
+FOOD_DTYPES = {
+    'Reporter_Country_name': 'category',
+    'Reporter_Country_name_x': 'category',
+    'Reporter_Country_name_y': 'category',
+    'Partner_Country_name': 'category',
+    'Item': 'category',
+    'Reporter_Country_ISO3': 'category',
+    'Reporter_Country_continent': 'category',
+    'Export_Quantity_2019_Value_tonnes': 'float64',
+}
+SOIL_DTYPES = {
+    'Reporter_Country_lon': 'float32',
+    'Reporter_Country_lat': 'float32',
+    **{soilIndex.socd_column(depth): 'float32' for depth in soilIndex.DEPTHS},
+    'Reporter_Country_name': 'category',
+    'Reporter_Country_continent': 'category',
+    'Reporter_Country_ISO3': 'category',
+    'Reporter_Country_pop_est': 'float64',
+}
+
+
+# read a CSV exported from the notebooks with its schema; its first column is the unnamed pandas index written by to_csv
+def read_csv(path, dtypes, skipped=()):
+    return pd.read_csv(path, index_col=0, dtype=dtypes, usecols=lambda column: column not in skipped)
+
+
+# print each column's dtype and memory use, e.g. at app startup
+def report_memory(name, df):
+    usage = df.memory_usage(index=False, deep=True)
+    print(f"{name}: {len(df):,} rows, {usage.sum() / 1e6:,.1f} MB")
+    for column, nbytes in usage.items():
+        print(f"  {column:<40} {str(df[column].dtype):<10} {nbytes / 1e6:10,.1f} MB")
+
+
+def read_store(store_path, skipped=()):
+    import pyarrow.parquet as pq
+    columns = [column for column in pq.read_schema(store_path).names if column not in skipped]
+    return pd.read_parquet(store_path, columns=columns)
+
+
+# load one dataset from its columnar store when it is built from the current CSV (or deployed without its CSV),
+# otherwise fall back to parsing its CSV; skipped columns are not read from either
+def load(store_path, csv_path, dtypes, skipped=()):
+    if os.path.exists(store_path) and (built_version() or not os.path.exists(csv_path)):
+        try:
+            return read_store(store_path, skipped)
+        except ImportError:
+            # no parquet engine (pyarrow) installed in this environment; the CSV is still a complete copy
+            pass
+    return read_csv(csv_path, dtypes, skipped)
+
+
+def load_food():
+    return load(FOOD_STORE, FOOD_CSV, FOOD_DTYPES)
+
+
+# the soil points with the SOCD of only the depths given, by default the surface depth the app starts with
+# (the other depths are drawn from their own memory-mapped arrays, see soilIndex.py)
+def load_soil(depths=(soilIndex.DEPTH,)):
+    skipped = {soilIndex.socd_column(depth) for depth in soilIndex.DEPTHS if depth not in depths}
+    return load(SOIL_STORE, SOIL_CSV, SOIL_DTYPES, skipped)
+
+
+# ----------------------------------------------------------------------------------------
+# build version: build() stamps what it built with each CSV's content hash and a hash of the building modules'
+# source, so the built files stay current through a clone, checkout or copy of the repository that changes the CSVs'
+# modification times but not their content, and can be deployed with it; the stamp also keeps each CSV's size and
+# modification time, so while those are unchanged (as on every boot of one deploy) checking that the built files are
+# current reads neither the datasets nor the built files themselves; a CSV that is not deployed (only its store is)
+# cannot be rebuilt from, and what was built from it is used as deployed
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def source_stat(path):
+    return f'{os.stat(path).st_size}:{os.stat(path).st_mtime_ns}'
+
+
+def source_versions():
+    return {path: {'sha256': content_hash(path), 'stat': source_stat(path)} for path in (FOOD_CSV, SOIL_CSV) if os.path.exists(path)}
+
+
+# whether a CSV is the one a build was stamped with: by its size and modification time when they match, otherwise
+# by its content, read only when its size is unchanged
+def source_current(path, built):
+    if built is None:
+        return False
+    if built['stat'] == source_stat(path):
+        return True
+    return built['stat'].split(':')[0] == str(os.stat(path).st_size) and built['sha256'] == content_hash(path)
+
+
+def code_version():
+    digest = hashlib.sha256()
+    for module in BUILD_MODULES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), module), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+stamp = None
+
+
+# the version of the built files when they are current with the CSV files and the code, otherwise None (when the
+# app builds what it needs in memory); the stamp is read once per process
+def built_version():
+    global stamp
+    if stamp is None:
+        stamp = {}
+        if os.path.exists(BUILD_STAMP):
+            with open(BUILD_STAMP) as f:
+                built = json.load(f)
+            sources = [path for path in (FOOD_CSV, SOIL_CSV) if os.path.exists(path)]
+            if built['code'] == code_version() and all(source_current(path, built.get('csvs', {}).get(path)) for path in sources):
+                stamp = built
+            else:
+                print(f"{BUILD_STAMP} is out of date with the data or code, so nothing built is used; rebuild with `python dataStore.py`")
+    return stamp.get('version')
+
+
+# ----------------------------------------------------------------------------------------
+# build step: write each CSV to its typed columnar store
+def build_store(csv_path, store_path, dtypes):
+    start = time.perf_counter()
+    df = read_csv(csv_path, dtypes)
+    df.to_parquet(store_path, engine='pyarrow', index=False)
+    print(f"{csv_path} ({os.path.getsize(csv_path) / 1e6:,.1f} MB) -> "
+          f"{store_path} ({os.path.getsize(store_path) / 1e6:,.1f} MB) "
+          f"in {time.perf_counter() - start:.1f} s")
+
+
+def build():
+    global stamp
+    # nothing built is current until every file is, so an interrupted build leaves none of them in use
+    if os.path.exists(BUILD_STAMP):
+        os.remove(BUILD_STAMP)
+    stamp = {}
+    sources, version = source_versions(), code_version()
+    build_store(FOOD_CSV, FOOD_STORE, FOOD_DTYPES)
+    build_store(SOIL_CSV, SOIL_STORE, SOIL_DTYPES)
+    dffood, dfsoil = read_store(FOOD_STORE), read_store(SOIL_STORE)
+    # partition the soil points by country for the map (see soilIndex.py)
+    soilIndex.SoilPyramid.from_index(soilIndex.SoilPointIndex.from_frame(dfsoil)).save()
+    print(f"per-country soil point index -> {soilIndex.INDEX_DIR}")
+    # aggregate the soil points to one row per country (see countryStats.py)
+    dfsoilStats = countryStats.depth_stats(dfsoil)
+    countryStats.save(dfsoilStats)
+    print(f"country soil statistics -> {countryStats.STATS_STORE}")
+    # the charts and trade arrays, saved under the build version (imported here, since they import this module)
+    import staticFigures
+    import tradeCube
+    import tradeIndex
+    # the version is of the CSVs' content and the code only, so it is the same wherever the repository is checked out
+    content = {path: source['sha256'] for path, source in sources.items()}
+    built = {'version': hashlib.sha256(json.dumps([content, version]).encode()).hexdigest()[:16], 'code': version, 'csvs': sources}
+    staticFigures.build(built['version'], dffood, dfsoilStats)
+    tradeCube.build(built['version'], dffood)
+    tradeIndex.build(built['version'], dffood)
+    with open(BUILD_STAMP + '.partial', 'w') as f:
+        json.dump(built, f, indent=2)
+    os.replace(BUILD_STAMP + '.partial', BUILD_STAMP)
+    stamp = built
+    print(f"build version {built['version']} -> {BUILD_STAMP}")
+
+
+if __name__ == '__main__':
+    build()
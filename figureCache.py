@@ -0,0 +1,67 @@
+# ----------------------------------------------------------------------------------------
+# bounded least-recently-used (LRU) cache of serialized figures
+#
+# there are only a few hundred possible selections of the map's trade partner dropdown, so the figure built for
+# each one is kept as its serialized JSON text; a repeat selection skips the slicing, figure building and plotly
+# validation entirely, and the cache evicts its least recently used figures once it holds more than max_entries
+# figures or max_bytes of JSON text
+
+import threading
+from collections import OrderedDict
+
+
+class FigureCache:
+    def __init__(self, max_entries=64, max_bytes=256 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> figure JSON text, least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Flask's development server handles requests in threads
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            figure = self.entries.get(key)
+            if figure is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return figure
+
+    def put(self, key, figure):
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= len(self.entries.pop(key))
+            # a figure larger than the whole cache is served but not kept
+            if len(figure) > self.max_bytes:
+                return
+            self.entries[key] = figure
+            self.bytes += len(figure)
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    # the cached figure JSON for a key, building and caching it with build(key) on a miss
+    def get_or_build(self, key, build):
+        figure = self.get(key)
+        if figure is None:
+            figure = build(key)
+            self.put(key, figure)
+        return figure
+
+    # build figures ahead of the first requests for them, e.g. for the most popular selections at server start
+    def prewarm(self, keys, build):
+        for key in keys:
+            if key not in self.entries:
+                self.put(key, build(key))
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'max_entries': self.max_entries, 'max_bytes': self.max_bytes}
@@ -0,0 +1,52 @@
+# ----------------------------------------------------------------------------------------
+# read-only arrays shared by every process serving the app, saved as .npy files and memory-mapped
+#
+# arrays built in memory at startup are private memory of the process that built them: under gunicorn --preload the
+# workers share the parent's copy only until a page of it is written, and without --preload (or in a worker
+# restarted on its own) each process builds and holds its own; a memory-mapped file is instead held once in the
+# operating system's page cache, whichever processes map it, is mapped read-only so no process can write to its
+# pages, and is read from disk only as slices of it are used (like the soil point index, see soilIndex.py)
+# a set of arrays is saved to its own directory, named by the build version of the data and code it is built from
+# (see dataStore.built_version), so arrays of other data or code are never opened
+
+import os
+import shutil
+import numpy as np
+
+
+# memory-map every array saved in a directory, read-only, by name
+def open_arrays(directory):
+    return {name[:-len('.npy')]: np.load(os.path.join(directory, name), mmap_mode='r')
+            for name in sorted(os.listdir(directory)) if name.endswith('.npy')}
+
+
+# replace a directory with one written in full beside it first by write(partial_directory), so a process starting
+# meanwhile never opens a partly written set and no file of the previous set is left behind; the previous files are
+# unlinked rather than overwritten, so a process that has them memory-mapped keeps reading their old contents
+def replace_directory(directory, write):
+    partial = f'{directory}.partial'
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    write(partial)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(partial, directory)
+
+
+# save arrays by name to a directory, replacing any arrays saved there before
+def save_arrays(directory, arrays):
+    def write(partial):
+        for name, array in arrays.items():
+            np.save(os.path.join(partial, f'{name}.npy'), np.asarray(array))
+    replace_directory(directory, write)
+
+
+# remove the saved arrays of previous versions from a directory of versions, keeping one
+def remove_previous(parent, keep):
+    for previous in os.listdir(parent):
+        path = os.path.join(parent, previous)
+        if path != keep:
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+
+def size_mb(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 1e6
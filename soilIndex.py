@@ -0,0 +1,348 @@
+# ----------------------------------------------------------------------------------------
+# per-country partitioned index of the soil measurement points for the map
+#
+# the soil points are sorted by country once, so that each country's points are one contiguous slice of the
+# lon, lat and SOCD arrays, and an offset table gives where each country's slice starts and stops;
+# built to .npy files the arrays are memory-mapped, so selecting a country reads only that country's rows
+# without scanning or copying the global dataset
+#
+# for the map's zoom levels, the index is also kept as a pyramid of coarser levels of detail: at each level the
+# grid cells are merged 2 x 2 into cells twice as wide, with the mean SOCD (and mean location) of the points
+# they merge, so a large country seen from far away is drawn from a bounded number of points
+#
+# for viewport queries, each country's points are further sorted by a uniform 1 degree lat/lon bucket grid, so the
+# points of a map window are one contiguous run of rows per bucket row it spans, found by binary search
+#
+# each SOCD depth is its own array file, memory-mapped only when the depth is first drawn, so memory grows only with
+# the depths users view
+#
+# built together with the columnar data store by running `python dataStore.py`
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import sharedArrays
+
+INDEX_DIR = os.path.join('.', 'data', 'soilIndex')
+
+# grid cell width in degrees at each level of detail: the SOCD data's own 5 arc-minute grid, then 10' up to 160'
+LEVEL_DEGREES = [2 ** level / 12 for level in range(6)]
+# most points drawn for one map view at any zoom, and the smallest on-screen cell width in pixels worth drawing
+MAX_POINTS = int(os.environ.get('MAP_MAX_POINTS', 25000))
+MIN_CELL_PIXELS = 3
+# width in degrees of the spatial buckets the points of each country are sorted by
+BUCKET_DEGREES = 1
+BUCKET_COLUMNS, BUCKET_ROWS = 360 // BUCKET_DEGREES, 180 // BUCKET_DEGREES
+
+# depths of the SOCD source data in cm, each a column of the soil data; the app shows the surface depth first
+DEPTHS = [4.5, 9.1, 16.6, 28.9, 49.3, 82.9, 138.3, 229.6]
+DEPTH = DEPTHS[0]
+
+
+# a depth as it is written in column and file names, e.g. 4.5 as '4_5'
+def depth_suffix(depth):
+    return f'{depth:g}'.replace('.', '_')
+
+
+def depth_key(depth):
+    return f'socd{depth_suffix(depth)}'
+
+
+def socd_column(depth):
+    return f'Reporter_Country_SOCD_depth{depth_suffix(depth)}'
+
+
+# point columns of the soil dataframe, saved as one array file each
+COLUMNS = {
+    'lon': 'Reporter_Country_lon',
+    'lat': 'Reporter_Country_lat',
+    **{depth_key(depth): socd_column(depth) for depth in DEPTHS},
+}
+
+
+class SoilPointIndex:
+    def __init__(self, countries, offsets, arrays, buckets, directory=None):
+        self.countries = countries  # country names, in sorted order
+        self.offsets = offsets  # country i's points are rows offsets[i] up to offsets[i + 1]
+        self.arrays = arrays  # column name -> array sorted by country, as loaded so far
+        self.buckets = buckets  # spatial bucket of each point, sorted within each country's rows
+        self.directory = directory  # where the arrays not loaded yet are saved, for an index opened from files
+        self.positions = {country: i for i, country in enumerate(countries)}
+        # the SOCD depths the index has, in memory or saved
+        self.depths = [depth for depth in DEPTHS if depth_key(depth) in arrays
+                       or directory and os.path.exists(os.path.join(directory, f'{depth_key(depth)}.npy'))]
+
+    # sort points by country code, and within a country by spatial bucket
+    @classmethod
+    def from_points(cls, countries, codes, arrays):
+        buckets = bucket_of(arrays['lon'], arrays['lat'])
+        order = np.lexsort((buckets, codes))
+        counts = np.bincount(codes[codes >= 0], minlength=len(countries))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        # points with no country name sort first (code -1) and are left out of every country's slice
+        offsets += int((codes < 0).sum())
+        return cls(countries, offsets, {key: array[order] for key, array in arrays.items()}, buckets[order])
+
+    # sort a soil dataframe's points by country, in memory
+    @classmethod
+    def from_frame(cls, df):
+        names = pd.Categorical(df['Reporter_Country_name'])
+        arrays = {key: df[column].to_numpy(dtype='float32') for key, column in COLUMNS.items() if column in df}
+        return cls.from_points(list(names.categories), names.codes.astype('int64'), arrays)
+
+    # memory-map an index saved with save(); arrays are read from disk only as slices of them are used,
+    # and a depth's SOCD array is not opened until the depth is first drawn
+    @classmethod
+    def open(cls, directory=INDEX_DIR):
+        with open(os.path.join(directory, 'countries.json')) as f:
+            countries = json.load(f)
+        offsets = np.load(os.path.join(directory, 'offsets.npy'))
+        arrays = {key: np.load(os.path.join(directory, f'{key}.npy'), mmap_mode='r') for key in ('lon', 'lat')}
+        return cls(countries, offsets, arrays, np.load(os.path.join(directory, 'buckets.npy'), mmap_mode='r'), directory)
+
+    def save(self, directory=INDEX_DIR):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'countries.json'), 'w') as f:
+            json.dump(self.countries, f)
+        np.save(os.path.join(directory, 'offsets.npy'), self.offsets)
+        for key, array in self.arrays.items():
+            np.save(os.path.join(directory, f'{key}.npy'), array)
+        np.save(os.path.join(directory, 'buckets.npy'), self.buckets)
+
+    # the row range of a country's points, empty for unknown or no selection
+    def bounds(self, country):
+        i = self.positions.get(country)
+        if i is None:
+            return 0, 0
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    # one of the index's arrays, memory-mapped from its file on first use
+    def column(self, key):
+        if key not in self.arrays:
+            self.arrays[key] = np.load(os.path.join(self.directory, f'{key}.npy'), mmap_mode='r')
+        return self.arrays[key]
+
+    # the lon, lat and one depth's SOCD arrays of the index
+    def point_arrays(self, depth=DEPTH):
+        return {'lon': self.column('lon'), 'lat': self.column('lat'), 'socd': self.column(depth_key(depth))}
+
+    # zero-copy views of one country's points, e.g. index.slice('Kenya')['lon']
+    def slice(self, country, depth=DEPTH):
+        start, stop = self.bounds(country)
+        return {key: array[start:stop] for key, array in self.point_arrays(depth).items()}
+
+    # the row ranges of a country's points in the buckets a lon/lat window overlaps, one range per bucket row
+    # (two when the window crosses the antimeridian); points in the window's edge buckets may lie outside it
+    def window_ranges(self, country, window):
+        start, stop = self.bounds(country)
+        buckets = self.buckets[start:stop]
+        west, south, east, north = window
+        rows = np.arange(bucket_row(south), bucket_row(north) + 1) * BUCKET_COLUMNS
+        starts, stops = [], []
+        for low, high in lon_spans(west, east):
+            starts.append(np.searchsorted(buckets, rows + bucket_column(low), 'left'))
+            stops.append(np.searchsorted(buckets, rows + bucket_column(high), 'right'))
+        return start + np.concatenate(starts), start + np.concatenate(stops)
+
+    # a country's points inside a lon/lat window (west, south, east, north), reading only the rows of the buckets it overlaps
+    def window(self, country, window, depth=DEPTH):
+        points, _ = self.select([country], depth, window)
+        return points
+
+    # the points of several countries, all of them or those inside a lon/lat window, read with one gather of the
+    # countries' concatenated row ranges instead of a mask per country, and how many of them each country has
+    # (in the order given), e.g. to split them into a trace per country
+    def select(self, countries, depth=DEPTH, window=None):
+        ranges = [self.window_ranges(country, window) if window is not None
+                  else tuple(np.array([bound]) for bound in self.bounds(country)) for country in countries]
+        starts = np.concatenate([starts for starts, _ in ranges] or [np.zeros(0, dtype='int64')])
+        stops = np.concatenate([stops for _, stops in ranges] or [np.zeros(0, dtype='int64')])
+        rows = range_rows(starts, stops)
+        points = {key: array[rows] for key, array in self.point_arrays(depth).items()}
+        counts = np.array([int((stops - starts).sum()) for starts, stops in ranges], dtype='int64')
+        if window is None:
+            return points, counts
+        west, south, east, north = window
+        inside = (((points['lon'] - west) % 360 <= min(east - west, 360))
+                  & (points['lat'] >= south) & (points['lat'] <= north))
+        counts = np.bincount(np.repeat(np.arange(len(countries)), counts)[inside], minlength=len(countries))
+        return {key: array[inside] for key, array in points.items()}, counts
+
+    # merge the points into grid cells of a coarser level of detail, a cell's point at the mean of the points it merges
+    # and its SOCD at each depth the mean of the merged points' values at that depth (missing values left out)
+    def coarsen(self, degrees):
+        start, stop = int(self.offsets[0]), int(self.offsets[-1])
+        keys = ['lon', 'lat'] + [depth_key(depth) for depth in self.depths]
+        values = {key: self.column(key)[start:stop] for key in keys}
+        lon, lat = values['lon'], values['lat']
+        country = np.repeat(np.arange(len(self.countries), dtype='int64'), np.diff(self.offsets))
+        columns, rows = int(np.ceil(360 / degrees)) + 1, int(np.ceil(180 / degrees)) + 1
+        column = np.floor((lon.astype('float64') + 180) / degrees).astype('int64')
+        row = np.floor((lat.astype('float64') + 90) / degrees).astype('int64')
+        # cells keep their country, so the coarser level is partitioned by country the same way
+        cells, cell = np.unique((country * rows + row) * columns + column, return_inverse=True)
+        arrays = {}
+        for key, array in values.items():
+            present = ~np.isnan(array)
+            sums = np.bincount(cell, weights=np.where(present, array, 0), minlength=len(cells))
+            counts = np.bincount(cell, weights=present, minlength=len(cells))
+            with np.errstate(invalid='ignore'):
+                arrays[key] = (sums / counts).astype('float32')
+        return SoilPointIndex.from_points(self.countries, cells // (rows * columns), arrays)
+
+
+# the per-country index at every level of detail, level 0 being the points themselves
+class SoilPyramid:
+    def __init__(self, levels):
+        self.levels = levels
+        self.countries = levels[0].countries
+        self.positions = levels[0].positions
+        self.depths = levels[0].depths
+
+    @classmethod
+    def from_index(cls, index):
+        return cls([index] + [index.coarsen(degrees) for degrees in LEVEL_DEGREES[1:]])
+
+    # level 0 is saved where a single level index is, and coarser levels in level1, level2, ... below it
+    @classmethod
+    def open(cls, directory=INDEX_DIR):
+        return cls([SoilPointIndex.open(level_dir(directory, level)) for level in range(len(LEVEL_DEGREES))])
+
+    # every level is written to a new directory that then replaces the previous index as a whole (see
+    # sharedArrays.replace_directory), so no depth or level of an earlier build is left beside the new offsets
+    def save(self, directory=INDEX_DIR):
+        def write(partial):
+            for level, index in enumerate(self.levels):
+                index.save(level_dir(partial, level))
+        sharedArrays.replace_directory(directory, write)
+
+    # points of a country (or of several together) at a level of detail, or of the buckets a lon/lat window
+    # overlaps (a close upper bound)
+    def count(self, country, level, window=None):
+        total = 0
+        for name in selected(country):
+            if window is not None:
+                starts, stops = self.levels[level].window_ranges(name, window)
+                total += int((stops - starts).sum())
+            else:
+                start, stop = self.levels[level].bounds(name)
+                total += stop - start
+        return total
+
+    # the finest level of detail for a country (or several sharing the budget) at a map zoom that draws cells at
+    # least MIN_CELL_PIXELS wide and keeps within the point budget, for the whole country or the window in view;
+    # without a zoom (e.g. before the map is moved) only the budget decides
+    def level_for(self, country, zoom=None, max_points=MAX_POINTS, window=None):
+        level = 0
+        if zoom is not None:
+            # a mapbox map is 512 pixels wide for 360 degrees at zoom 0, doubling with each zoom level
+            pixels_per_degree = 512 * 2 ** zoom / 360
+            while level < len(self.levels) - 1 and LEVEL_DEGREES[level] * pixels_per_degree < MIN_CELL_PIXELS:
+                level += 1
+        while level < len(self.levels) - 1 and self.count(country, level, window) > max_points:
+            level += 1
+        return level
+
+    # one country's points at a level of detail and depth, all of them or those inside a lon/lat window, evenly
+    # thinned in the rare case that even the coarsest level holds more points than the budget
+    def slice(self, country, level=0, max_points=MAX_POINTS, window=None, depth=DEPTH):
+        if window is None:
+            points = self.levels[level].slice(country, depth)
+        else:
+            points = self.levels[level].window(country, window, depth)
+        step = -(-len(points['lon']) // max_points) if max_points else 1
+        if step > 1:
+            points = {key: array[::step] for key, array in points.items()}
+        return points
+
+    # each of several countries' points at a level of detail and depth, gathered together, all of them or those
+    # inside a lon/lat window; when together they hold more points than the budget, every country is thinned
+    # by the same step, so their densities stay comparable side by side
+    def select(self, countries, level=0, max_points=MAX_POINTS, window=None, depth=DEPTH):
+        if not len(countries):
+            return []
+        points, counts = self.levels[level].select(countries, depth, window)
+        step = -(-int(counts.sum()) // max_points) if max_points else 1
+        splits = np.cumsum(counts)[:-1]
+        selection = [dict(zip(points, arrays)) for arrays in zip(*(np.split(array, splits) for array in points.values()))]
+        if step > 1:
+            selection = [{key: array[::step] for key, array in country.items()} for country in selection]
+        return selection
+
+
+# a dropdown's selection as a list of countries: none, one country name, or a list of them
+def selected(countries):
+    if countries is None:
+        return []
+    if isinstance(countries, str):
+        return [countries]
+    return list(countries)
+
+
+# the row numbers of several row ranges, concatenated in order
+def range_rows(starts, stops):
+    lengths = stops - starts
+    return np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+
+
+def level_dir(directory, level):
+    return directory if level == 0 else os.path.join(directory, f'level{level}')
+
+
+def bucket_column(lon):
+    return np.clip(np.floor((np.asarray(lon, dtype='float64') + 180) / BUCKET_DEGREES), 0, BUCKET_COLUMNS - 1).astype('int32')
+
+
+def bucket_row(lat):
+    return np.clip(np.floor((np.asarray(lat, dtype='float64') + 90) / BUCKET_DEGREES), 0, BUCKET_ROWS - 1).astype('int32')
+
+
+def bucket_of(lon, lat):
+    return bucket_row(lat) * BUCKET_COLUMNS + bucket_column(lon)
+
+
+# the longitude ranges within -180 to 180 of a window's west to east, which a map panned across the antimeridian
+# gives as longitudes beyond 180 (or below -180)
+def lon_spans(west, east):
+    width = east - west
+    if width >= 360:
+        return [(-180, 180)]
+    west = (west + 180) % 360 - 180
+    east = west + max(width, 0)
+    if east > 180:
+        return [(west, 180), (-180, east - 360)]
+    return [(west, east)]
+
+
+# the lon/lat window (west, south, east, north) of a map view from its corner coordinates,
+# as in the relayoutData of a map moved in the browser (mapbox._derived.coordinates)
+def viewport(corners):
+    lons, lats = [lon for lon, lat in corners], [lat for lon, lat in corners]
+    return min(lons), max(min(lats), -90), max(lons), min(max(lats), 90)
+
+
+# a window widened by a fraction of its size on every side, so the map can be panned a little within the points sent
+def pad(window, fraction=0.5):
+    west, south, east, north = window
+    width, height = (east - west) * fraction, (north - south) * fraction
+    if east - west + 2 * width >= 360:
+        west, east, width = -180, 180, 0
+    return west - width, max(south - height, -90), east + width, min(north + height, 90)
+
+
+# whether a window lies inside another, e.g. the map's view inside the window its points were sent for;
+# a window of None being the whole country
+def contains(outer, inner):
+    if outer is None:
+        return True
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+
+# use the prebuilt index files when they are current (see dataStore.built_version), otherwise sort and coarsen the
+# soil dataframe given (the app's already loaded soil data), or loaded for it, once at startup
+def load(df=None, directory=INDEX_DIR):
+    import dataStore  # imported here, since it imports this module
+    if dataStore.built_version() and os.path.exists(os.path.join(level_dir(directory, len(LEVEL_DEGREES) - 1), 'buckets.npy')):
+        return SoilPyramid.open(directory)
+    return SoilPyramid.from_index(SoilPointIndex.from_frame(dataStore.load_soil() if df is None else df))
@@ -0,0 +1,69 @@
+# ----------------------------------------------------------------------------------------
+# encoding of the soil points sent to the browser for the map
+#
+# every value of a trace's lon, lat and marker size arrays is written out as JSON text in the callback response,
+# so only the selected points are sent, at no more decimals than the data carries: the SOCD grid is on
+# 5 arc-minute (1/12 degree) steps, so 4 decimals keep each coordinate exact to within about 10 meters, and
+# marker sizes in pixels need no more than 1 decimal
+# (float32 values would otherwise be written with the float64 digits of their nearest binary value, e.g. -100.58333587646484)
+
+import base64
+import numpy as np
+import soilIndex
+
+COORDINATE_DECIMALS = 4
+SIZE_DECIMALS = 1
+
+
+# round an array to its shortest faithful decimal text, e.g. for a Scattermapbox lon, lat or marker size
+def encode(values, decimals):
+    return np.round(np.asarray(values, dtype='float64'), decimals)
+
+
+# the lon, lat and marker size arrays of a slice of soil points, ready for a Scattermapbox trace
+def encode_points(points):
+    return {
+        'lon': encode(points['lon'], COORDINATE_DECIMALS),
+        'lat': encode(points['lat'], COORDINATE_DECIMALS),
+        'size': encode(points['socd'], SIZE_DECIMALS),
+    }
+
+
+# little-endian float32 bytes of an array as base64 text, which the browser decodes to a Float32Array (4 bytes a value)
+# instead of parsing decimal text, for the clientside map
+def encode_binary(values):
+    return base64.b64encode(np.ascontiguousarray(values, dtype='<f4').tobytes()).decode('ascii')
+
+
+# the lon, lat and marker size arrays of a slice of soil points as base64 float32
+def encode_points_binary(points):
+    return {
+        'lon': encode_binary(points['lon']),
+        'lat': encode_binary(points['lat']),
+        'size': encode_binary(encode(points['socd'], SIZE_DECIMALS)),
+    }
+
+
+# approximate width in pixels of the map on a desktop screen, for fitting a country's extent into view
+MAP_PIXELS = 900
+
+
+# lon/lat extent (west, south, east, north) of a country's points, or of several countries' together, from its
+# coarsest level of detail (the same extent in far fewer points); None without any points
+def country_bounds(pyramid, country):
+    points, _ = pyramid.levels[-1].select(soilIndex.selected(country))
+    if not len(points['lon']):
+        return None
+    return [float(points['lon'].min()), float(points['lat'].min()), float(points['lon'].max()), float(points['lat'].max())]
+
+
+# map center and zoom showing all of a country, or of several countries together
+def country_view(pyramid, country):
+    bounds = country_bounds(pyramid, country)
+    if bounds is None:
+        return {'center': {'lon': 0, 'lat': 20}, 'zoom': 1}
+    west, south, east, north = bounds
+    # the map is about twice as wide as it is tall; a mapbox map is 512 pixels wide for 360 degrees at zoom 0
+    extent = max(east - west, 2 * (north - south), 1)
+    zoom = float(np.clip(np.log2(360 * MAP_PIXELS / (512 * extent)), 0, 10))
+    return {'center': {'lon': round((west + east) / 2, 4), 'lat': round((south + north) / 2, 4)}, 'zoom': round(zoom, 2)}
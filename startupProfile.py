@@ -0,0 +1,73 @@
+# ----------------------------------------------------------------------------------------
+# startup profile of the app: wall time and resident memory (RSS) of each named stage of app.py's module-level
+# loading, e.g. its package imports, data loads, indexes and prebuilt charts
+#
+# a stage is everything app.py runs between one mark() and the next, so the module-level code itself is not
+# wrapped or reordered; with the profile off (the default), mark() and report() do nothing
+# enabled by the environment variable STARTUP_PROFILE: 1 prints the JSON report when app.py finishes loading,
+# and a file path writes it there instead, e.g. to compare boots between data releases:
+#   STARTUP_PROFILE=startup.json python -c "import app"
+# with gunicorn --preload the app is loaded once, in the parent process, so one report covers every worker's boot
+
+import json
+import os
+import resource
+import sys
+import time
+
+PROFILE = os.environ.get('STARTUP_PROFILE', '0')
+ENABLED = PROFILE != '0'
+
+# memory pages are counted in /proc/self/statm on Linux
+PAGE_BYTES = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+# the process's resident memory in MB now, or its peak where the current size is not available (e.g. macOS)
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_BYTES / 1e6
+    except OSError:
+        return peak_rss_mb()
+
+
+# the process's peak resident memory in MB, which the kernel reports in kilobytes on Linux and bytes on macOS
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak * 1024 / 1e6
+
+
+# the profile starts when this module is imported, first thing in app.py
+started = time.perf_counter()
+stages = []
+last = (started, rss_mb() if ENABLED else 0.0)
+
+
+# end the stage that began at the previous mark (or at the start), naming what it ran
+def mark(name):
+    global last
+    if not ENABLED:
+        return
+    now, rss = time.perf_counter(), rss_mb()
+    stages.append({'stage': name, 'seconds': round(now - last[0], 4),
+                   'rss_mb': round(rss, 1), 'rss_delta_mb': round(rss - last[1], 1)})
+    last = (now, rss)
+
+
+# the JSON report of every stage, printed or written to the STARTUP_PROFILE file
+def report():
+    if not ENABLED:
+        return
+    profile = {
+        'pid': os.getpid(),
+        'python': sys.version.split()[0],
+        'seconds': round(time.perf_counter() - started, 4),
+        'rss_mb': round(rss_mb(), 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'stages': stages,
+    }
+    if PROFILE == '1':
+        print(json.dumps(profile, indent=2))
+    else:
+        with open(PROFILE, 'w') as f:
+            json.dump(profile, f, indent=2)
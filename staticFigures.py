@@ -0,0 +1,161 @@
+# ----------------------------------------------------------------------------------------
+# the app's static charts: Density Ranges of average soil organic carbon density, and At Risk Foods
+#
+# neither chart changes with the map's selections (the Density Ranges chart is made once for each SOCD depth),
+# so both are rendered once by an offline build to JSON files named by
+# the build version of the data they are made from (see dataStore.built_version); app workers then load the JSON
+# directly at startup, without grouping the data or running plotly express, and fall back to building a chart only
+# when its file is missing or out of date; built with the rest of the app's data by `python dataStore.py`
+
+import json
+import os
+import plotly
+import plotly.express as px
+import countryStats
+import dataStore
+import humanFormat
+import soilIndex
+
+FIGURES_DIR = os.path.join(dataStore.DATA_DIR, 'figures')
+
+
+# --------------------------SOIL BAR graph--------------------------
+def density_ranges_figure(dfsoilStats):
+    # the mean SOCD of each Country from the country-level soil statistics (see countryStats.py), without the raw SOCD values; used in density ranges bar chart
+    dfsoilMeans = dfsoilStats[['Reporter_Country_name', 'Reporter_Country_continent', 'SOCDcountryMean', 'Reporter_Country_pop_est']].copy()
+    dfsoilMeansMaxOrder = ['Africa', 'Oceania', 'South America', 'Asia', 'North America', 'Europe']
+    # make numbers into a more human readable format, e.g., transform 12345591313 to '12.3 billion' for hover info
+    dfsoilMeans['humanPop'] = humanFormat.intword(dfsoilMeans['Reporter_Country_pop_est'])
+
+    # make a bar chart showing range of mean by countries, overlay countries within continent group to retain mean y axis levels
+    rangeSOCDfig = px.bar(dfsoilMeans, x='Reporter_Country_continent', y='SOCDcountryMean', color='SOCDcountryMean', barmode='overlay',
+                          # set bolded title in hover text, and make a list of columns to customize how they appear in hover text
+                          custom_data=['Reporter_Country_name',
+                                       'Reporter_Country_continent',
+                                       'SOCDcountryMean',
+                                       'humanPop'
+                                       ],
+                          color_continuous_scale=px.colors.sequential.speed,  # alternately use turbid for more muted yellows to browns (speed for yellow to green to black scale)
+                          # a better label that will display over color legend
+                          labels={'SOCDcountryMean': 'Avg.<br>SOCD'},
+                          # lower opacity to help see variations of color between countries as means change
+                          opacity=0.20
+                          )
+    # sort bars by mean SOCD, and suppress redundant axis titles, instead of xaxis={'categoryorder': 'mean ascending'} I pre-sorted the dataframe above, but still force sort here by explicit names
+    rangeSOCDfig.update_layout(xaxis={'categoryorder': 'array', 'categoryarray': dfsoilMeansMaxOrder},
+                               xaxis_title=None, yaxis_title=None,  # removed xaxis_tickangle=-45, # used to angle longer/more xaxis labels
+                               paper_bgcolor='#e8ece8',  # next tint variation up from a low tint of #dadeda
+                               plot_bgcolor='#f7f5fc',  # violet tone of medium purple to help greens pop forward
+                               yaxis={'gridcolor': '#e8ece8'},  # match grid lines shown to background to appear as showing through
+                               font={'color': '#483628'})  # a dark shade of orange that appears dark brown
+    rangeSOCDfig.update_traces(
+        hovertemplate="<br>".join([
+            "<b>%{customdata[0]} </b><br>",  # bolded hover title included, since the separate hover_name is superseced by hovertemplae
+            "%{customdata[1]}",  # Continent value with no label
+            "Average SOCD: %{customdata[2]:.1f} t ha<sup>−1</sup>",  # with html <sup> superscript tag in abbr. metric tonnes per hectare (t ha-1) t ha<sup>−1</sup> formatted to 2 decimals
+            "Estimated Population (2019): %{customdata[3]} people"  # in humanized format
+        ])
+    )
+    return rangeSOCDfig
+
+
+# --------------------------FOOD TRADE graph--------------------------
+# one row per Partner (importing) Country summarizing its food imports, the source of the scatterplot's points
+def risk_foods_summary(dffood):
+    # take the sum total of exported tonnes and the distinct count of exported items by grouping food dataframe by Partner Country,
+    # aggregated to one row per country instead of appended as columns repeating each country's totals on all its trade rows
+    dffoodPartners = dffood.groupby('Partner_Country_name', observed=True).agg(
+        Export_Quantity_Sum=('Export_Quantity_2019_Value_tonnes', 'sum'),
+        Export_Items_Count=('Item', 'nunique')
+    ).reset_index()
+    # make numbers into a more human readable format, e.g., transform 12345591313 to '12.3 billion' for hover info
+    dffoodPartners['tradeVolume'] = humanFormat.intword(dffoodPartners['Export_Quantity_Sum'])
+    return dffoodPartners
+
+
+def risk_foods_figure(dffood):
+    return risk_foods_chart(risk_foods_summary(dffood))
+
+
+def risk_foods_chart(dffoodPartners):
+    # food data scatterplot points, one per partner country
+    RiskFoodsFig = px.scatter(dffoodPartners, x='Export_Items_Count', y='Export_Quantity_Sum', size='Export_Quantity_Sum',
+                              custom_data=['Partner_Country_name',  # 'Reporter_Country_name_x',
+                                           'Export_Quantity_Sum',
+                                           'Export_Items_Count'
+                                           ]
+                              )
+
+    # sort bars by mean SOCD, and suppress redundant axis titles, instead of xaxis={'categoryorder': 'mean ascending'} I pre-sorted the dataframe above, but still force sort here by explicit names
+    RiskFoodsFig.update_layout(
+                               xaxis_title='Diversity of Foods Imported (How many unique items?)',  # Exported (How many unique items?)',
+                               # move yaxis text to title area for readability; add empty line above it so it appears below the plotly toolbar options
+                               title='<br>Volume as Total Quantity of Foods Imported (tonnes)',
+                               yaxis_title='',  # moved to title attribute for readability
+                               paper_bgcolor='#e8ece8',  # next tint variation up from a low tint of #dadeda
+                               plot_bgcolor='#f7f5fc',  # violet tone of medium purple to help greens pop forward
+                               yaxis={'gridcolor': '#e8ece8'},  # match grid lines shown to background to appear as showing through
+                               font={'color': '#483628'})  # a dark shade of orange that appears dark brown
+    RiskFoodsFig.update_traces(
+        # hard code single point color
+        marker=dict(
+            color='#a99e54',
+            sizemin=10
+        ),
+        # set bolded title in hover text, and make a list of columns to customize how they appear in hover text
+        hovertemplate="<br>".join([
+            "<b>%{customdata[0]} </b><br>",  # bolded hover title included, since the separate hover_name is superseced by hovertemplae
+            "Trade Volume: %{customdata[1]:,} tonnes imported",  # %{customdata[2]:,} tonnes exported", # note html tags can be used in string; comma sep formatted; note with tradeVolume use format .1f to 1 decimals
+            "Trade Diversity: %{customdata[2]:} unique food products imported"  # %{customdata[3]:} unique food products exported",
+        ])
+    )
+    return RiskFoodsFig
+
+
+# the Density Ranges chart's name at a SOCD depth, the surface depth's being densityRanges
+def density_ranges_name(depth=soilIndex.DEPTH):
+    return 'densityRanges' if depth == soilIndex.DEPTH else f'densityRanges{soilIndex.depth_suffix(depth)}'
+
+
+# each chart, with the function making it and a function loading the data it is made from
+FIGURES = {
+    **{density_ranges_name(depth): (density_ranges_figure, lambda depth=depth: countryStats.load(depth=depth))
+       for depth in soilIndex.DEPTHS},
+    'riskFoods': (risk_foods_figure, dataStore.load_food),
+}
+
+
+# ----------------------------------------------------------------------------------------
+def figure_path(name, version):
+    return os.path.join(FIGURES_DIR, f'{name}-{version}.json')
+
+
+# a chart as a figure dictionary for dcc.Graph, from its prebuilt JSON when it matches the current data;
+# otherwise built from the dataframe given (the app's already loaded data) or loaded for it
+def load(name, df=None):
+    make_figure, load_data = FIGURES[name]
+    version = dataStore.built_version()
+    if version and os.path.exists(figure_path(name, version)):
+        with open(figure_path(name, version)) as f:
+            return json.load(f)
+    return make_figure(load_data() if df is None else df)
+
+
+# build step (see dataStore.build): render each chart to JSON once from the trade data and every depth's country soil
+# statistics, and remove the files of previous versions; charts with no data (e.g. the Density Ranges of a depth the
+# soil data does not have) are not built
+def build(version, dffood, dfsoilStats):
+    os.makedirs(FIGURES_DIR, exist_ok=True)
+    data = {density_ranges_name(depth): dfsoilStats[dfsoilStats['SOCDdepth'] == depth].drop(columns='SOCDdepth')
+            for depth in soilIndex.DEPTHS}
+    data['riskFoods'] = dffood
+    for name, (make_figure, _) in FIGURES.items():
+        path = figure_path(name, version)
+        if not len(data[name]):
+            continue
+        with open(path, 'w') as f:
+            json.dump(make_figure(data[name]), f, cls=plotly.utils.PlotlyJSONEncoder)
+        print(f"{name} -> {path} ({os.path.getsize(path) / 1e6:,.1f} MB)")
+    for previous in os.listdir(FIGURES_DIR):
+        if not previous.endswith(f'-{version}.json'):
+            os.remove(os.path.join(FIGURES_DIR, previous))
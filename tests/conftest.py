@@ -0,0 +1,7 @@
+# ----------------------------------------------------------------------------------------
+# the tests import the app's modules from the project's root directory, as the app and the benchmarks are run from it
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
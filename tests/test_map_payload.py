@@ -0,0 +1,39 @@
+# ----------------------------------------------------------------------------------------
+# regression test of the map callback's response payload size (see benchmarks/mapPayload.py)
+#
+# the app is imported in a temporary directory holding a small synthetic dataset (see benchmarks/syntheticData.py),
+# built as it is deployed, and a selection of countries is posted to its callback endpoint as the browser does;
+# the response must stay within a fixed overhead per country plus a budget per point drawn
+
+import importlib
+import os
+import pytest
+from benchmarks import mapPayload, syntheticData
+
+POINTS = 20000
+TRADE_ROWS = 5000
+COUNTRIES = 20
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('synthetic')
+    syntheticData.generate(str(directory), POINTS, TRADE_ROWS, countries_count=COUNTRIES)
+    # the app reads ./data, so stays in the directory while it is tested
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        import dataStore
+        dataStore.build()
+        yield importlib.import_module('app')
+    finally:
+        os.chdir(cwd)
+
+
+# the largest country (thinned to the map's point budget), the smallest, and both selected together
+@pytest.mark.parametrize('countries', [['Country 000'], [f'Country {COUNTRIES - 1:03d}'], ['Country 000', f'Country {COUNTRIES - 1:03d}']])
+def test_map_payload_within_budget(app, countries):
+    result = mapPayload.measure(app, countries)
+    assert result['status'] == 200
+    assert result['points'] > 0
+    assert result['payload_bytes'] <= result['budget_bytes'], result
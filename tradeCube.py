@@ -0,0 +1,132 @@
+# ----------------------------------------------------------------------------------------
+# aggregate cube of the food trade matrix, for drilling down from an importing country of the At Risk Foods chart
+#
+# the trade rows are summed once into compact arrays: tonnes by (exporter, importer) pair and by (importer, item)
+# pair, each sorted by importer and then by tonnes, largest first, with an offset table of where each importer's
+# pairs start and stop, and each importer's total tonnes and count of distinct items; a clicked country's top source
+# countries and foods are then the first rows of its slices, with no grouping of the trade data per click
+#
+# saved as .npy files in a directory named by the build version of the trade data it is summed from, and memory-mapped
+# read-only at startup, so every gunicorn worker reads the one copy in the page cache (see sharedArrays.py); built with
+# the rest of the app's data by `python dataStore.py`
+
+import os
+import numpy as np
+import pandas as pd
+import dataStore
+import sharedArrays
+
+CUBE_DIR = os.path.join(dataStore.DATA_DIR, 'tradeCube')
+
+# columns of the food trade dataframe (see dataStore.py): exporters by their FAO name, the same naming as importers
+REPORTER = 'Reporter_Country_name_x'
+PARTNER = 'Partner_Country_name'
+ITEM = 'Item'
+QUANTITY = 'Export_Quantity_2019_Value_tonnes'
+
+
+class TradeCube:
+    def __init__(self, arrays):
+        self.partners = list(arrays['partners'])  # importing countries' names, in sorted order
+        self.reporters = list(arrays['reporters'])  # exporting countries' names
+        self.items = list(arrays['items'])  # food item names
+        self.partner_total = arrays['partner_total']  # each importer's total tonnes
+        self.partner_items = arrays['partner_items']  # each importer's count of distinct items
+        # importer i's (exporter, tonnes) pairs are rows source_offsets[i] up to source_offsets[i + 1], and its
+        # (item, tonnes) pairs rows item_offsets[i] up to item_offsets[i + 1], largest tonnes first
+        self.source_offsets, self.source, self.source_tonnes = arrays['source_offsets'], arrays['source'], arrays['source_tonnes']
+        self.item_offsets, self.item, self.item_tonnes = arrays['item_offsets'], arrays['item'], arrays['item_tonnes']
+        self.arrays = arrays
+        self.positions = {name: i for i, name in enumerate(self.partners)}
+
+    # sum a food trade dataframe's rows into the cube
+    @classmethod
+    def from_frame(cls, df):
+        labels = {column: pd.Categorical(df[column]) for column in (REPORTER, PARTNER, ITEM)}
+        codes = {column: labels[column].codes.astype('int64') for column in labels}
+        quantity = df[QUANTITY].to_numpy(dtype='float64')
+        # trade rows without an importer, or a quantity, are left out of every total
+        kept = (codes[PARTNER] >= 0) & ~np.isnan(quantity)
+        partner, quantity = codes[PARTNER][kept], quantity[kept]
+        partners = len(labels[PARTNER].categories)
+        source_offsets, source, source_tonnes = pair_totals(partner, codes[REPORTER][kept], quantity, partners)
+        item_offsets, item, item_tonnes = pair_totals(partner, codes[ITEM][kept], quantity, partners)
+        return cls({
+            'partners': np.asarray(labels[PARTNER].categories, dtype=str),
+            'reporters': np.asarray(labels[REPORTER].categories, dtype=str),
+            'items': np.asarray(labels[ITEM].categories, dtype=str),
+            'partner_total': np.bincount(partner, weights=quantity, minlength=partners),
+            'partner_items': np.diff(item_offsets).astype('int32'),
+            'source_offsets': source_offsets, 'source': source, 'source_tonnes': source_tonnes,
+            'item_offsets': item_offsets, 'item': item, 'item_tonnes': item_tonnes,
+        })
+
+    @classmethod
+    def open(cls, path):
+        return cls(sharedArrays.open_arrays(path))
+
+    def save(self, path):
+        sharedArrays.save_arrays(path, self.arrays)
+
+    # an importer's largest source countries, as (name, tonnes) pairs, e.g. cube.sources('China', 10)
+    def sources(self, partner, limit=None):
+        start, stop = self.bounds(partner, self.source_offsets)
+        stop = stop if limit is None else min(stop, start + limit)
+        return [(self.reporters[code], float(tonnes)) for code, tonnes in zip(self.source[start:stop], self.source_tonnes[start:stop])]
+
+    # an importer's largest food items, as (name, tonnes) pairs
+    def foods(self, partner, limit=None):
+        start, stop = self.bounds(partner, self.item_offsets)
+        stop = stop if limit is None else min(stop, start + limit)
+        return [(self.items[code], float(tonnes)) for code, tonnes in zip(self.item[start:stop], self.item_tonnes[start:stop])]
+
+    # an importer's total tonnes and count of distinct items, zero for unknown countries
+    def totals(self, partner):
+        i = self.positions.get(partner)
+        if i is None:
+            return 0.0, 0
+        return float(self.partner_total[i]), int(self.partner_items[i])
+
+    def bounds(self, partner, offsets):
+        i = self.positions.get(partner)
+        if i is None:
+            return 0, 0
+        return int(offsets[i]), int(offsets[i + 1])
+
+
+# tonnes summed by (importer, other) code pairs, sorted by importer and then by tonnes, largest first, with the offsets
+# of each importer's pairs; pairs whose other label is missing are left out
+def pair_totals(partner, other, quantity, partners):
+    kept = other >= 0
+    partner, other, quantity = partner[kept], other[kept], quantity[kept]
+    width = int(other.max(initial=-1)) + 1
+    pairs, pair = np.unique(partner * width + other, return_inverse=True)
+    tonnes = np.bincount(pair.ravel(), weights=quantity, minlength=len(pairs))
+    pair_partner, pair_other = np.divmod(pairs, max(width, 1))
+    order = np.lexsort((-tonnes, pair_partner))
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(pair_partner, minlength=partners))])
+    return offsets, pair_other[order].astype('int32'), tonnes[order]
+
+
+# ----------------------------------------------------------------------------------------
+# saved under the build version of the data (see dataStore.built_version)
+def cube_path(version):
+    return os.path.join(CUBE_DIR, f'tradeCube-{version}')
+
+
+# the cube from its saved arrays when they are current, otherwise summed from the dataframe given
+# (the app's already loaded trade data) or loaded for it
+def load(dffood=None):
+    version = dataStore.built_version()
+    if version and os.path.isdir(cube_path(version)):
+        return TradeCube.open(cube_path(version))
+    return TradeCube.from_frame(dataStore.load_food() if dffood is None else dffood)
+
+
+# build step (see dataStore.build): sum the cube once from the trade data, and remove the arrays of previous versions
+def build(version, dffood):
+    os.makedirs(CUBE_DIR, exist_ok=True)
+    path = cube_path(version)
+    TradeCube.from_frame(dffood).save(path)
+    sharedArrays.remove_previous(CUBE_DIR, path)
+    print(f"food trade cube -> {path} ({sharedArrays.size_mb(path):,.1f} MB)")
@@ -0,0 +1,155 @@
+# ----------------------------------------------------------------------------------------
+# indexed lookups of the food trade matrix by exporting country, importing country and item
+#
+# the trade rows are sorted once by exporting (reporter) country, and within each exporter by item and importing
+# (partner) country, so that each exporter's rows are one contiguous slice of the code and quantity arrays, found
+# from an offset table as in the soil point index (see soilIndex.py); a second ordering of the same rows by importer
+# gives each importing country's rows the same way, and an item within either is found by binary search, so a lookup
+# reads only the rows it returns instead of masking the whole trade table
+#
+# exporters are keyed by ISO3 code, which links them to the soil data's countries (the trade partners of the dropdown),
+# since the FAO and naturalearth names of a country often differ
+#
+# saved as .npy files in a directory named by the build version of the trade data, and memory-mapped read-only at
+# startup like the trade cube (see sharedArrays.py); built with the rest of the app's data by `python dataStore.py`
+
+import os
+import numpy as np
+import pandas as pd
+import dataStore
+import sharedArrays
+
+INDEX_DIR = os.path.join(dataStore.DATA_DIR, 'tradeIndex')
+
+# columns of the food trade dataframe (see dataStore.py)
+REPORTER = 'Reporter_Country_ISO3'
+PARTNER = 'Partner_Country_name'
+ITEM = 'Item'
+QUANTITY = 'Export_Quantity_2019_Value_tonnes'
+
+
+class TradeIndex:
+    def __init__(self, arrays):
+        self.reporters = list(arrays['reporters'])  # exporting countries' ISO3 codes, in sorted order
+        self.partners = list(arrays['partners'])  # importing countries' names, in sorted order
+        self.items = list(arrays['items'])  # food item names, in sorted order
+        # each row's exporter, importer and item code and quantity in tonnes, sorted by exporter, item and importer
+        self.reporter, self.partner, self.item, self.quantity = arrays['reporter'], arrays['partner'], arrays['item'], arrays['quantity']
+        self.reporter_offsets = arrays['reporter_offsets']
+        # the rows ordered by importer and item, without copying them
+        self.by_partner, self.partner_offsets = arrays['by_partner'], arrays['partner_offsets']
+        self.arrays = arrays
+        self.reporter_positions = {code: i for i, code in enumerate(self.reporters)}
+        self.partner_positions = {name: i for i, name in enumerate(self.partners)}
+        self.item_positions = {name: i for i, name in enumerate(self.items)}
+
+    # sort a food trade dataframe's rows by exporter, item and importer, with each label as an integer code
+    @classmethod
+    def from_frame(cls, df):
+        labels = {column: pd.Categorical(df[column]) for column in (REPORTER, PARTNER, ITEM)}
+        codes = {column: labels[column].codes.astype('int32') for column in labels}
+        order = np.lexsort((codes[PARTNER], codes[ITEM], codes[REPORTER]))
+        reporter, partner, item = (codes[column][order] for column in (REPORTER, PARTNER, ITEM))
+        by_partner = np.lexsort((reporter, item, partner))
+        return cls({
+            'reporters': np.asarray(labels[REPORTER].categories, dtype=str),
+            'partners': np.asarray(labels[PARTNER].categories, dtype=str),
+            'items': np.asarray(labels[ITEM].categories, dtype=str),
+            'reporter': reporter, 'partner': partner, 'item': item,
+            'quantity': df[QUANTITY].to_numpy(dtype='float64')[order],
+            'reporter_offsets': offsets(reporter, len(labels[REPORTER].categories)),
+            'by_partner': by_partner,
+            'partner_offsets': offsets(partner[by_partner], len(labels[PARTNER].categories)),
+        })
+
+    @classmethod
+    def open(cls, path):
+        return cls(sharedArrays.open_arrays(path))
+
+    def save(self, path):
+        sharedArrays.save_arrays(path, self.arrays)
+
+    # the rows of an exporter's trade, or of one of its items; rows ordered by exporter, item and importer
+    def reporter_rows(self, reporter, item=None):
+        i = self.reporter_positions.get(reporter)
+        if i is None:
+            return np.arange(0)
+        start, stop = int(self.reporter_offsets[i]), int(self.reporter_offsets[i + 1])
+        if item is not None:
+            start, stop = item_bounds(self.item, start, stop, self.item_positions.get(item))
+        return np.arange(start, stop)
+
+    # the rows of an importer's trade, or of one of its items
+    def partner_rows(self, partner, item=None):
+        i = self.partner_positions.get(partner)
+        if i is None:
+            return np.arange(0)
+        start, stop = int(self.partner_offsets[i]), int(self.partner_offsets[i + 1])
+        if item is not None:
+            start, stop = item_bounds(self.item[self.by_partner[start:stop]], 0, stop - start, self.item_positions.get(item), start)
+        return self.by_partner[start:stop]
+
+    # the trade rows as a table of labels and tonnes, largest quantities first, or only the largest limit of them
+    def table(self, rows, limit=None):
+        if limit is not None and limit < len(rows):
+            rows = rows[np.argpartition(-self.quantity[rows], limit)[:limit]]
+        rows = rows[np.argsort(-self.quantity[rows], kind='stable')]
+        return pd.DataFrame({
+            REPORTER: np.asarray(self.reporters, dtype=object)[self.reporter[rows]],
+            PARTNER: np.asarray(self.partners, dtype=object)[self.partner[rows]],
+            ITEM: np.asarray(self.items, dtype=object)[self.item[rows]],
+            QUANTITY: self.quantity[rows],
+        })
+
+    # what an exporter (by ISO3 code) exports and to whom, e.g. index.exports('KEN'), or one item's importers
+    def exports(self, reporter, item=None, limit=None):
+        return self.table(self.reporter_rows(reporter, item), limit)
+
+    # where an importer's food comes from, e.g. index.imports('China'), or one item's exporters
+    def imports(self, partner, item=None, limit=None):
+        return self.table(self.partner_rows(partner, item), limit)
+
+    # an exporter's total tonnes, and how many distinct items it exports and countries it exports to
+    def export_totals(self, reporter):
+        rows = self.reporter_rows(reporter)
+        return (float(self.quantity[rows].sum()), len(np.unique(self.item[rows])), len(np.unique(self.partner[rows])))
+
+
+# where the rows of each code start and stop in rows sorted by that code; rows without a label
+# (code -1) sort first and are left out of every code's rows
+def offsets(codes, count):
+    counts = np.bincount(codes[codes >= 0], minlength=count)
+    return np.concatenate([[0], np.cumsum(counts)]) + int((codes < 0).sum())
+
+
+# the rows of one item code within rows start to stop sorted by item, by binary search; shifted by base when the
+# codes are a slice of the rows
+def item_bounds(items, start, stop, code, base=0):
+    if code is None:
+        return base, base
+    return (base + start + int(np.searchsorted(items[start:stop], code, 'left')),
+            base + start + int(np.searchsorted(items[start:stop], code, 'right')))
+
+
+# ----------------------------------------------------------------------------------------
+# saved under the build version of the data (see dataStore.built_version)
+def index_path(version):
+    return os.path.join(INDEX_DIR, f'tradeIndex-{version}')
+
+
+# the index from its saved arrays when they are current, otherwise sorted from the dataframe given
+# (the app's already loaded trade data) or loaded for it
+def load(dffood=None):
+    version = dataStore.built_version()
+    if version and os.path.isdir(index_path(version)):
+        return TradeIndex.open(index_path(version))
+    return TradeIndex.from_frame(dataStore.load_food() if dffood is None else dffood)
+
+
+# build step (see dataStore.build): sort the index once from the trade data, and remove the arrays of previous versions
+def build(version, dffood):
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    path = index_path(version)
+    TradeIndex.from_frame(dffood).save(path)
+    sharedArrays.remove_previous(INDEX_DIR, path)
+    print(f"food trade index -> {path} ({sharedArrays.size_mb(path):,.1f} MB)")